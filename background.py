@@ -0,0 +1,88 @@
+"""
+Searching in a background thread
+
+Only the latest requested search matters: requesting a new one cancels
+the running search (it stops at its next node) and drops the waiting one.
+Sequences that are not remembered are predicted by a search.Predictor, so
+a typed number that was predicted is answered without a search.
+"""
+from threading import Condition, Event, Thread
+
+import search
+
+
+class BackgroundSearch(Thread):
+    """ A thread running the latest requested search
+    Usage:
+        searcher = BackgroundSearch()
+        searcher.start()
+        searcher.request([1, 2, 3], callback)  # callback(seq, result)
+    callback is called in the background thread, and not at all for
+    cancelled searches.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.condition = Condition()
+        self.job = None  # (seq, remember, callback)
+        self.cancel = Event()
+        self.stopped = False
+        self.predictor = search.Predictor()
+
+    def request(self, seq, callback, remember=False):
+        """ Search seq instead of anything requested before """
+        with self.condition:
+            self.cancel.set()
+            self.job = (seq, remember, callback)
+            self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.cancel.set()
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.job is None and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                (seq, remember, callback), self.job = self.job, None
+                self.cancel = cancel = Event()
+
+            try:
+                if remember:
+                    result = search.findNext(seq, cancel=cancel)
+                else:
+                    result = self.predictor.predict(seq, cancel=cancel)
+            except search.SearchCancelled:
+                continue
+            if not cancel.is_set():
+                callback(seq, result)
+
+
+def test():
+    from time import sleep
+
+    results = []
+    searcher = BackgroundSearch()
+    searcher.start()
+
+    # only the last of quickly requested searches gives a result
+    for seq in ([1], [1, 2], [1, 2, 3], [1, 2, 3, 4]):
+        searcher.request(seq, lambda seq, result: results.append(
+            (seq, result.value)))
+    for _ in range(200):
+        if results:
+            break
+        sleep(0.01)
+    sleep(0.05)
+    searcher.stop()
+    searcher.join()
+    assert results[-1] == ([1, 2, 3, 4], 5)
+
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,263 @@
+"""
+Benchmarks of the search
+
+Runs the lab.py cases and hard cases, the lab.py cases with other depth
+limits and some sequence families with growing length (up to 1000 numbers
+searched by all methods). For every run it
+records the answer, wall time (best of --repeat), expanded sequences per
+search method and peak memory (tracemalloc).
+    python bench.py --save baseline.json      # store results
+    python bench.py --baseline baseline.json  # report regressions
+    python bench.py > bench_output.txt
+    python bench.py --orders                  # fixed against learned order
+The exit status is 1 when some run got worse than in the baseline.
+"""
+import argparse
+import json
+import random
+import sys
+import tracemalloc
+from time import perf_counter
+
+import search
+from lab import cases, hard_cases
+
+# family name --> function returning the sequence of length n
+families = {
+    "cubic": lambda n: [i**3 - 2 * i + 5 for i in range(n)],
+    "fibonacci": lambda n: fibonacci(n),
+    "alternating": lambda n: [(-1)**i * (i * i + 1) for i in range(n)],
+    "doubling": lambda n: [3 * 2**i + i for i in range(n)],
+    "random": lambda n: randoms(n),
+}
+
+
+def fibonacci(n):
+    seq = [2, 1]
+    while len(seq) < n:
+        seq.append(seq[-1] + seq[-2])
+    return seq[:n]
+
+
+def randoms(n):
+    rnd = random.Random(n)
+    return [rnd.randint(-50, 50) for _ in range(n)]
+
+
+def measure(seq, repeat=3):
+    """ Search seq with empty caches and return a dict of results, every
+    search starts with the wins of methods there were before """
+    scheduler = search.method_scheduler
+
+    def reset():
+        search.transposition_table.clear()
+        search.canonical_cache.clear()
+        search.method_scheduler = scheduler.copy()
+
+    times = []
+    try:
+        for _ in range(repeat):
+            reset()
+            start = perf_counter()
+            result = search.findNext(seq, remember=False)
+            times.append(perf_counter() - start)
+
+        reset()
+        tracemalloc.start()
+        search.findNext(seq, remember=False)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        search.method_scheduler = scheduler
+
+    return {"answer": result.value,
+            "depth": result.depth,
+            "time": min(times),
+            "nodes": result.extra_info["nodes"],
+            "expanded": result.extra_info["expanded"],
+            "memory": peak}
+
+
+def runs(depth_limits, lengths):
+    """ Yield (name, sequence, expected, depth limit) of every run """
+    for i, (seq, expected) in enumerate(cases):
+        if isinstance(expected, set):
+            expected = sorted(expected)
+        for limit in depth_limits:
+            yield "lab/{}".format(i), seq, expected, limit
+    for i, (seq, expected) in enumerate(hard_cases):
+        yield "hard/{}".format(i), seq, expected, depth_limits[0]
+    for family, make in families.items():
+        for n in lengths:
+            seq = make(n + 1)
+            expected = None if family == "random" else seq.pop()
+            yield "{}/{}".format(family, n), seq, expected, depth_limits[0]
+
+
+def run(depth_limits, lengths, repeat=3):
+    """ Return a dict of run key --> results """
+    results = {}
+    old_limit = search.depth_limit
+    search.report = False
+    try:
+        for name, seq, expected, limit in runs(depth_limits, lengths):
+            search.depth_limit = limit
+            key = "{} depth_limit={}".format(name, limit)
+            results[key] = measure(seq, repeat)
+            results[key]["sequence"] = seq
+            results[key]["expected"] = expected
+    finally:
+        search.depth_limit = old_limit
+    return results
+
+
+def compare_orders(depth_limits, lengths, repeat=3):
+    """ Return (fixed, learned) results of run() with search methods in
+    their fixed order and in the order learned (see seq_schedule.py) from
+    searching every run once before """
+    old = search.adaptive_order, search.depth_limit, search.method_scheduler
+    search.report = False
+    try:
+        search.adaptive_order = False
+        fixed = run(depth_limits, lengths, repeat)
+        search.adaptive_order = True
+        search.method_scheduler = old[2].copy()
+        search.method_scheduler.clear()
+        for name, seq, expected, limit in runs(depth_limits, lengths):
+            search.depth_limit = limit
+            search.transposition_table.clear()
+            search.canonical_cache.clear()
+            search.findNext(seq, remember=False)
+        learned = run(depth_limits, lengths, repeat)
+    finally:
+        (search.adaptive_order, search.depth_limit,
+         search.method_scheduler) = old
+    return fixed, learned
+
+
+def report_orders(fixed, learned, file=sys.stdout):
+    print("{:<32}{:>12}{:>8}{:>8}{:>10}{:>10}".format(
+        "run", "answer", "fixed", "learned", "fixed ms", "learned ms"),
+        file=file)
+    for key, result in fixed.items():
+        other = learned[key]
+        assert other["answer"] == result["answer"], key
+        print("{:<32}{:>12}{:>8}{:>8}{:>10.2f}{:>10.2f}".format(
+            key, str(result["answer"])[:11], result["nodes"],
+            other["nodes"], 1000 * result["time"], 1000 * other["time"]),
+            file=file)
+
+    totals = []
+    for results in (fixed, learned):
+        totals.append((sum(result["nodes"] for result in results.values()),
+                       sum(result["time"] for result in results.values())))
+    (fixed_nodes, fixed_time), (learned_nodes, learned_time) = totals
+    print("total: {} --> {} nodes ({:+.1f}%), {:.1f} --> {:.1f} ms "
+          "({:+.1f}%)".format(
+              fixed_nodes, learned_nodes,
+              100 * (learned_nodes / fixed_nodes - 1),
+              1000 * fixed_time, 1000 * learned_time,
+              100 * (learned_time / fixed_time - 1)), file=file)
+
+
+def solved(result):
+    expected = result["expected"]
+    if isinstance(expected, list):
+        return result["answer"] in expected
+    return expected is not None and result["answer"] == expected
+
+
+def report(results, file=sys.stdout):
+    print("{:<32}{:>12}{:>7}{:>10}{:>8}{:>10}  {}".format(
+        "run", "answer", "ok", "ms", "nodes", "KiB", "nodes by method"),
+        file=file)
+    for key, result in results.items():
+        expanded = ", ".join("{}={}".format(method.replace("by", ""), count)
+                             for method, count in sorted(
+                                 result["expanded"].items()))
+        print("{:<32}{:>12}{:>7}{:>10.2f}{:>8}{:>10.1f}  {}".format(
+            key, str(result["answer"])[:11],
+            "yes" if solved(result) else "-",
+            1000 * result["time"], result["nodes"],
+            result["memory"] / 1024, expanded), file=file)
+
+    total_time = sum(result["time"] for result in results.values())
+    total_nodes = sum(result["nodes"] for result in results.values())
+    count = sum(solved(result) for result in results.values())
+    print("total: {:.1f} ms, {} nodes, {} of {} solved".format(
+        1000 * total_time, total_nodes, count, len(results)), file=file)
+
+
+def compare(results, baseline, time_tolerance=0.5, node_tolerance=0.1,
+            memory_tolerance=0.25):
+    """ Return a list of regressions (strings) of results against
+    baseline. Tolerances are allowed relative growths. """
+    regressions = []
+    for key, old in baseline.items():
+        new = results.get(key)
+        if new is None:
+            continue
+        if new["answer"] != old["answer"]:
+            kind = "lost" if solved(old) and not solved(new) else "changed"
+            regressions.append("{}: answer {} {} --> {}".format(
+                key, kind, old["answer"], new["answer"]))
+        if new["nodes"] > old["nodes"] * (1 + node_tolerance) + 1:
+            regressions.append("{}: nodes {} --> {}".format(
+                key, old["nodes"], new["nodes"]))
+        # small times are mostly noise
+        if (new["time"] > old["time"] * (1 + time_tolerance) and
+                new["time"] - old["time"] > 0.001):
+            regressions.append("{}: time {:.2f} ms --> {:.2f} ms".format(
+                key, 1000 * old["time"], 1000 * new["time"]))
+        if (new["memory"] > old["memory"] * (1 + memory_tolerance) and
+                new["memory"] - old["memory"] > 10 * 1024):
+            regressions.append("{}: memory {:.1f} KiB --> {:.1f} KiB".format(
+                key, old["memory"] / 1024, new["memory"] / 1024))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--depth-limits", type=int, nargs="+",
+                        default=[7, 3, 5, 9],
+                        help="the first one is used for all runs, the "
+                             "others only for the lab cases")
+    parser.add_argument("--lengths", type=int, nargs="+",
+                        default=[6, 12, 25, 50, 100, 1000],
+                        help="lengths of the family sequences, long ones "
+                             "show methods that are slow per number")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", help="write results to this file")
+    parser.add_argument("--baseline", help="compare with this file")
+    parser.add_argument("--time-tolerance", type=float, default=0.5)
+    parser.add_argument("--orders", action="store_true",
+                        help="compare the fixed and the learned order of "
+                             "search methods")
+    args = parser.parse_args()
+
+    if args.orders:
+        report_orders(*compare_orders(args.depth_limits, args.lengths,
+                                      args.repeat))
+        return
+
+    results = run(args.depth_limits, args.lengths, args.repeat)
+    report(results)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.time_tolerance)
+        print("\n{} regressions against {}".format(
+            len(regressions), args.baseline))
+        for regression in regressions:
+            print("  " + regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,9 @@
+import sys
+from collections import OrderedDict
+
+from helper import prime_table
 from seq_repr import NormalRepr
+from seq_index import SequenceIndex
 
 
 class WellKnownSequence(NormalRepr):
@@ -6,11 +11,22 @@ class WellKnownSequence(NormalRepr):
     Attributes:
         familiarity: size of smallest part that isneeded to recognize
                      the sequence
+        name: (str) like "A000045" for OEIS sequences or None
     """
+    __slots__ = ("familiarity", "name")
 
-    def __init__(self, *args, familiarity=3, **kwargs):
-        super().__init__(*args, **kwargs)
+    def __init__(self, numbers=(), familiarity=3, name=None):
+        super().__init__(numbers)
         self.familiarity = familiarity
+        self.name = name
+
+    def __reduce__(self):
+        return WellKnownSequence, (self.numbers, self.familiarity, self.name)
+
+    def reversed_copy(self):
+        """ Return a reversed copy of the sequence """
+        return WellKnownSequence(self.numbers[::-1],
+                                 familiarity=self.familiarity, name=self.name)
 
 
 known_sequences = [
@@ -20,8 +36,80 @@ known_sequences = [
     WellKnownSequence([3**i for i in range(0, 8)], familiarity=3),
     WellKnownSequence([4**i for i in range(0, 7)], familiarity=3),
     WellKnownSequence([10**i for i in range(0, 5)], familiarity=3),
-    WellKnownSequence([2, 3, 5, 7, 11, 13, 17, 19, 23], familiarity=4),
+    WellKnownSequence(prime_table(1000), familiarity=4),
 ]
 
-reverses = [s.reversed_copy() for s in known_sequences]
-known_sequences.extend(reverses)
+# known sequences also match when read backwards
+known_index = SequenceIndex(known_sequences, reversible=True)
+
+
+class LocalSequences:
+    """ Bounded memory of sequences given by users
+    Sequences are deduplicated and the least recently given ones are
+    forgotten when there are more than max_count of them or they take more
+    than max_bytes.
+    Attributes:
+        enabled: if False nothing is remembered
+        max_count: maximum number of sequences
+        max_bytes: maximum (estimated) memory taken by sequences
+        bytes: (estimated) memory taken by sequences
+    """
+
+    def __init__(self, max_count=10000, max_bytes=16 * 2**20, enabled=True):
+        self.enabled = enabled
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.index = SequenceIndex()
+        # sequence --> (id in index, size in bytes)
+        self.entries = OrderedDict()
+
+    def add(self, seq):
+        """ Remember seq, return True if remembered sequences changed """
+        if not self.enabled:
+            return False
+
+        if not isinstance(seq, NormalRepr):
+            seq = WellKnownSequence(seq)
+        if seq in self.entries:
+            self.entries.move_to_end(seq)
+            return False
+
+        size = (sys.getsizeof(seq) + sys.getsizeof(seq.numbers) +
+                sum(map(sys.getsizeof, seq)))
+        self.entries[seq] = (self.index.add(seq), size)
+        self.bytes += size
+        while len(self.entries) > 1 and (len(self.entries) > self.max_count or
+                                         self.bytes > self.max_bytes):
+            self.forget()
+        return True
+
+    def forget(self):
+        """ Forget the least recently given sequence """
+        key, (id, size) = self.entries.popitem(last=False)
+        self.index.remove(id)
+        self.bytes -= size
+
+    def remove(self, seq):
+        """ Forget seq """
+        if not isinstance(seq, NormalRepr):
+            # sequences are equal to tuples of their numbers
+            seq = tuple(seq)
+        id, size = self.entries.pop(seq)
+        self.index.remove(id)
+        self.bytes -= size
+
+    def match(self, seq):
+        """ Same as SequenceIndex.match """
+        return self.index.match(seq)
+
+    def clear(self):
+        self.entries.clear()
+        self.index = SequenceIndex()
+        self.bytes = 0
+
+    def __iter__(self):
+        return iter(self.index.sequences.values())
+
+    def __len__(self):
+        return len(self.entries)
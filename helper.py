@@ -1,3 +1,13 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from fractions import Fraction
+from math import log
+
+
 def sign(x):
     if x > 0:
         return 1
@@ -6,25 +16,240 @@ def sign(x):
     return 0
 
 
-def write_primes(n):
-    """Writes prime numbers to file "prime_numbers" as a list"""
-    primes = [2, 3, 5, 7, 11]
-    for i in range(primes[-1] + 1, n):
-        for j in primes:
-            if i % j == 0:
+# primes are kept as bits of odd numbers: bit i is 2 * i + 1
+PRIMES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           "primes.bin")
+PRIMES_MAGIC = b"PRIMES\x00\x01"
+PRIMES_HEADER = struct.Struct("=8s8sQQ")
+# odd numbers in a block, prime counts are kept for every block
+BLOCK = 4096
+BLOCK_BYTES = BLOCK // 8
+_DIGITS = bytes.maketrans(b"\x00\x01", b"01")
+_BIT_COUNTS = bytes(bin(i).count("1") for i in range(256))
+
+
+def sieve_blocks(limit, segment=2**22):
+    """Segmented sieve of Eratosthenes, memory does not depend on limit.
+    Yields bytes of BLOCK * k bits for odd numbers below limit (the last
+    ones are padded with zeros)"""
+    size = limit // 2  # odd numbers below limit
+    root = int(limit ** 0.5) + 1
+    small = bytearray([1]) * (root + 1)
+    small[:2] = b"\x00\x00"
+    for i in range(2, int(root ** 0.5) + 1):
+        if small[i]:
+            small[i * i::i] = bytes(len(range(i * i, root + 1, i)))
+    base = [p for p in range(3, root + 1, 2) if small[p]]
+
+    segment -= segment % BLOCK
+    for lo in range(0, size, segment):
+        hi = min(lo + segment, size)
+        flags = bytearray([1]) * (hi - lo)
+        if lo == 0:
+            flags[0] = 0  # 1 is not prime
+        for p in base:
+            first = p * p
+            if first >= 2 * hi:
+                break
+            if first < 2 * lo + 1:
+                # the first odd multiple of p from 2 * lo + 1
+                first = (2 * lo + 1 + p - 1) // p * p
+                if first % 2 == 0:
+                    first += p
+            start = (first - 1) // 2 - lo
+            flags[start::p] = bytes(len(range(start, hi - lo, p)))
+        flags.extend(bytes(-len(flags) % BLOCK))
+        yield int(flags.translate(_DIGITS), 2).to_bytes(len(flags) // 8,
+                                                        "big")
+
+
+class PrimeTable:
+    """Primes below limit as bits of odd numbers together with the number
+    of primes before every block of bits
+    Attributes:
+        limit: primes below it are known"""
+
+    def __init__(self, limit, bits, counts):
+        self.limit = limit
+        self.bits = bits
+        self.counts = counts
+
+    @classmethod
+    def sieve(cls, limit):
+        """Return a table of primes below limit kept in memory"""
+        bits = bytearray()
+        counts = array("Q")
+        total = 0
+        for chunk in sieve_blocks(limit):
+            for b in range(0, len(chunk), BLOCK_BYTES):
+                counts.append(total)
+                total += _count_bits(chunk[b:b + BLOCK_BYTES])
+            bits += chunk
+        counts.append(total)
+        return cls(limit, bits, counts)
+
+    def is_prime(self, n):
+        if n < 3 or n % 2 == 0:
+            return n == 2
+        if n >= self.limit:
+            raise ValueError("{} is not below {}".format(n, self.limit))
+        i = n // 2
+        return self.bits[i >> 3] >> (7 - (i & 7)) & 1 == 1
+
+    def prime_index(self, n):
+        """Return the number of primes not bigger than n, so that
+        nth_prime(prime_index(p)) == p for primes p"""
+        if n < 2:
+            return 0
+        if n >= self.limit:
+            raise ValueError("{} is not below {}".format(n, self.limit))
+        i = (n - 1) // 2  # the last odd number not bigger than n
+        block = i // BLOCK
+        start, byte = block * BLOCK_BYTES, i >> 3
+        last = self.bits[byte] >> (7 - (i & 7))
+        return (1 + self.counts[block] +
+                _count_bits(self.bits[start:byte]) + _BIT_COUNTS[last])
+
+    def nth_prime(self, n):
+        """Return the n-th prime (nth_prime(1) == 2)"""
+        if n < 1:
+            raise ValueError("primes are counted from 1")
+        if n == 1:
+            return 2
+        if n - 1 > self.counts[-1]:
+            raise ValueError("there are less than {} primes below {}".format(
+                n, self.limit))
+        n -= 1  # odd primes
+        block = bisect_left(self.counts, n) - 1
+        n -= self.counts[block]
+        byte = block * BLOCK_BYTES
+        while _BIT_COUNTS[self.bits[byte]] < n:
+            n -= _BIT_COUNTS[self.bits[byte]]
+            byte += 1
+        value = self.bits[byte]
+        for bit in range(8):
+            if value >> (7 - bit) & 1:
+                n -= 1
+                if not n:
+                    return 2 * (8 * byte + bit) + 1
+
+    def __contains__(self, n):
+        return self.is_prime(n)
+
+    def __len__(self):
+        return 1 + self.counts[-1] if self.limit > 2 else 0
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("prime index out of range")
+        return self.nth_prime(i + 1)
+
+    def __iter__(self):
+        if self.limit > 2:
+            yield 2
+        for byte, value in enumerate(self.bits):
+            for bit in range(8):
+                if value >> (7 - bit) & 1:
+                    yield 2 * (8 * byte + bit) + 1
+
+    def __repr__(self):
+        return "<PrimeTable of {} primes below {}>".format(
+            len(self), self.limit)
+
+
+def _count_bits(data):
+    return bin(int.from_bytes(data, "big")).count("1")
+
+
+def write_primes(n, path=PRIMES_FILE):
+    """Writes prime numbers below n to a binary file (see read_primes)
+    without keeping them in memory"""
+    blocks = (n // 2 + BLOCK - 1) // BLOCK
+    counts = array("Q")
+    total = 0
+    with open(path, "wb") as f:
+        f.write(PRIMES_HEADER.pack(PRIMES_MAGIC, sys.byteorder.encode(), n,
+                                   blocks))
+        for chunk in sieve_blocks(n):
+            for b in range(0, len(chunk), BLOCK_BYTES):
+                counts.append(total)
+                total += _count_bits(chunk[b:b + BLOCK_BYTES])
+            f.write(chunk)
+        counts.append(total)
+        counts.tofile(f)
+
+
+def read_primes(path=PRIMES_FILE):
+    """Returns the PrimeTable of a file written by write_primes,
+    the file is memory mapped"""
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, order, limit, blocks = PRIMES_HEADER.unpack_from(data)
+    if (magic != PRIMES_MAGIC or
+            order.rstrip(b"\x00") != sys.byteorder.encode()):
+        raise ValueError("{} is not a prime table of this machine".format(
+            path))
+    view = memoryview(data)
+    start = PRIMES_HEADER.size
+    end = start + blocks * BLOCK_BYTES
+    return PrimeTable(limit, view[start:end],
+                      view[end:end + 8 * (blocks + 1)].cast("Q"))
+
+
+_primes = None
+
+
+def prime_table(limit=2**16):
+    """Returns a PrimeTable with at least the primes below limit: the one
+    in PRIMES_FILE if it is big enough, otherwise a sieved one"""
+    global _primes
+    if _primes is None or _primes.limit < limit:
+        if os.path.exists(PRIMES_FILE):
+            table = read_primes()
+            if table.limit >= limit:
+                _primes = table
+                return _primes
+        old = _primes.limit if _primes is not None else 0
+        _primes = PrimeTable.sieve(max(limit, 2 * old))
+    return _primes
+
+
+def is_prime(n):
+    """Check if n is prime, numbers beyond the prime table are tested by
+    Miller-Rabin (exact below 3.3 * 10**24)"""
+    table = prime_table()
+    if n < table.limit:
+        return table.is_prime(n)
+    if n % 2 == 0:
+        return False
+    d, r = n - 1, 0
+    while d % 2 == 0:
+        d, r = d // 2, r + 1
+    for a in (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41):
+        x = pow(a, d, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(r - 1):
+            x = x * x % n
+            if x == n - 1:
                 break
         else:
-            primes.append(i)
+            return False
+    return True
+
 
-    with open("prime_numbers", 'w') as f:
-        f.write(str(primes))
+def nth_prime(n):
+    """Return the n-th prime (nth_prime(1) == 2)"""
+    # p(n) < n * (ln n + ln ln n) for n >= 6
+    bound = 15 if n < 6 else int(n * (log(n) + log(log(n)))) + 1
+    return prime_table(bound + 1).nth_prime(n)
 
 
-def read_primes():
-    """Reads prime numbers from file "prime_numbers"
-    and returns it as a list"""
-    with open("prime_numbers", "r") as f:
-        return eval(f.readline())
+def prime_index(n):
+    """Return the number of primes not bigger than n"""
+    return prime_table(n + 1).prime_index(n)
 
 
 def iter_pairs(seq, cycle=False):
@@ -79,6 +304,75 @@ def match_seq(s, seq):
     return (match_size, seq[match_b + 1])
 
 
+def recurrence_order(seq, limit=None, modulo=2**61 - 1):
+    """Return the order of the shortest linear recurrence of seq taken
+    modulo a prime (Berlekamp-Massey), or some order above limit as soon
+    as it is known to be bigger. It is not bigger than the order over the
+    rationals unless the prime divides some denominator."""
+    # C is kept multiplied by some factor instead of dividing by b
+    C, B = [1], [1]
+    L, m, b = 0, 1, 1
+    for n in range(len(seq)):
+        d = sum(C[i] * seq[n - i] for i in range(L + 1)) % modulo
+        if d == 0:
+            m += 1
+            continue
+
+        T = C[:]
+        C = [b * c % modulo for c in C]
+        C.extend([0] * (len(B) + m - len(C)))
+        for i, Bi in enumerate(B):
+            C[i + m] = (C[i + m] - d * Bi) % modulo
+        if 2 * L <= n:
+            L, B, b, m = n + 1 - L, T, d, 1
+            if limit is not None and L > limit:
+                return L
+        else:
+            m += 1
+    return L
+
+
+def linear_recurrence(seq, extra=2, max_order=None):
+    """Find the shortest linear recurrence of seq by Berlekamp-Massey
+    over the rationals: seq[i] = c[0] * seq[i-1] + ... + c[r-1] * seq[i-r]
+    The recurrence is only trusted if it was checked on at least r + extra
+    terms after the first r (len(seq) >= 2 * r + extra). Orders above
+    max_order are not looked for, then a sequence without a recurrence
+    costs O(max_order * len(seq)) instead of O(len(seq) ** 2).
+    Returns the list c of Fractions or None"""
+    # most sequences have no short recurrence, integers find it out faster
+    limit = (len(seq) - extra) // 2
+    if max_order is not None:
+        limit = min(limit, max_order)
+    if recurrence_order(seq, limit) > limit:
+        return None
+
+    # connection polynomial: seq[i] + C[1] * seq[i-1] + ... = 0
+    C, B = [Fraction(1)], [Fraction(1)]
+    L, m, b = 0, 1, Fraction(1)
+    for n in range(len(seq)):
+        d = seq[n] + sum(C[i] * seq[n - i] for i in range(1, L + 1))
+        if d == 0:
+            m += 1
+            continue
+
+        coef = d / b
+        T = C[:]
+        C.extend([Fraction(0)] * (len(B) + m - len(C)))
+        for i, Bi in enumerate(B):
+            C[i + m] -= coef * Bi
+        if 2 * L <= n:
+            L, B, b, m = n + 1 - L, T, d, 1
+            # L never gets smaller
+            if 2 * L + extra > len(seq):
+                return None
+        else:
+            m += 1
+
+    C.extend([Fraction(0)] * (L + 1 - len(C)))
+    return [-c for c in C[1:L + 1]]
+
+
 def test_match_seq():
     seq = [1, 4, 9, 16]
     s = [1, 4, 9]
@@ -97,7 +391,36 @@ def test_match_seq():
     assert match_seq(s, seq) == (0, None)
 
 
+def test_primes():
+    primes = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47]
+    table = PrimeTable.sieve(50)
+    assert list(table) == primes and len(table) == len(primes)
+    assert [n for n in range(50) if n in table] == primes
+    assert [table.nth_prime(i) for i in range(1, 16)] == primes
+    assert [table.prime_index(p) for p in primes] == list(range(1, 16))
+    assert table.prime_index(48) == 15
+    # segments meet where they should
+    assert b"".join(sieve_blocks(10**5, segment=BLOCK)) == bytes(
+        PrimeTable.sieve(10**5).bits)
+    assert nth_prime(10**4) == 104729 and prime_index(104729) == 10**4
+    assert is_prime(2**61 - 1) and not is_prime(2**61 + 1)
+
+
+def test_linear_recurrence():
+    assert linear_recurrence([1, 1, 2, 3, 5, 8]) == [1, 1]
+    assert linear_recurrence([1, 1, 2, 3, 5]) is None
+    assert linear_recurrence([8, 12, 18, 27]) == [Fraction(3, 2)]
+    assert linear_recurrence([1, 2, 3, 4, 5, 6]) == [2, -1]
+    assert linear_recurrence([0, 0, 0, 1]) is None
+    assert recurrence_order([1, 1, 2, 3, 5, 8, 13]) == 2
+    assert recurrence_order([3, 1, 4, 1, 5, 9, 2, 6]) == 4
+    assert linear_recurrence([3, 1, 4, 1, 5, 9, 2, 6, 5, 3, 5],
+                             max_order=3) is None
+
+
 if __name__ == "__main__":
-    # write_primes(100)
+    # write_primes(10**9)
     # primes = read_primes()
     test_match_seq()
+    test_primes()
+    test_linear_recurrence()
@@ -1,39 +1,195 @@
+import random
+from time import perf_counter
+
 import search
 from search import findNext
 
 search.depth_limit = 7
 
 
+# (sequence, expected next number or a set of acceptable ones)
+cases = [
+    ([1, 2, 3, 4], 5),
+    ([1, 4, 9], 16),
+    ([1, 8, 27], 64),
+    ([23, 34, 45, 56, 67], 78),
+    ([0, 1, 0, 1], 0),
+    ([12, 15, 21, 24, 30], 33),
+    ([1, 2, 4, 8], 16),
+    ([1, 3, 9, 27], 81),
+    ([2, 5, 14, 41], 122),
+    ([1, -2, 3, -4], 5),
+    ([1, -2, 4, -8, 16], -32),
+    ([4, 6, 9, 13, 18], 24),
+    ([12, 15, 21, 24, 30], 33),
+    ([1, 1, 2, 3, 5, 8], 13),
+    ([-2, 4, -12, 48, -240], 1440),
+    ([1, 10, 3, 9, 5, 8, 7, 7], 9),
+    ([2, 3, 5, 7, 11, 13, 17, 19], 23),
+    ([200, 196, 180, 116], -140),
+    ([144, 121, 100, 81], 64),
+    ([3, 10, 20, 27, 37], 44),
+    ([80, 10, 70, 15, 60], 20),
+    ([8, 6, 9, 23, 87], 429),
+    ([5, 11, 23, 47], 95),
+    ([7, 13, 24, 45], 86),
+    ([14, 28, 20, 40, 32, 64], 56),
+    ([1, 1, 2, 3, 5], {8, 7}),
+]
+
+# cases the search does not solve (yet), expected is None if unknown
+hard_cases = [
+    ([21, 24, 30, 33, 39, 51], 56),
+    ([101, 112, 131, 415, 161, 718], 192),  # 10, 11, 12, 13, 14 ...
+    ([1, 2, 3, 4, 1, 2, 3, 4, 2, 1], None),  # related to roman numbers
+    ([20000, 2000, 200, 20], 2),  # ratio but reversed
+    ([243, 162, 108, 72], 48),  # times 2/3
+    ([2, 5, 10, 50], 500),
+    ([99, 1616, 2525, 3636], 4949),
+    ([44, 99, 166, 255], None),
+    ([1000, 100, 10], 1),
+    ([1, 3, 5, 11, 21], 43),
+    ([1, 6, 28, 145], 876),  # times 2 + i
+    ([4, 2, 3, 4, 6, 2, 3], None),
+]
+
+
 def test():
     search.report = False
-    assert findNext([1, 2, 3, 4]).value == 5
-    assert findNext([1, 4, 9]).value == 16
-    assert findNext([1, 8, 27]).value == 64
-    assert findNext([23, 34, 45, 56, 67]).value == 78
-    assert findNext([0, 1, 0, 1]).value == 0
-    assert findNext([12, 15, 21, 24, 30]).value == 33
-    assert findNext([1, 2, 4, 8]).value == 16
-    assert findNext([1, 3, 9, 27]).value == 81
-    assert findNext([2, 5, 14, 41]).value == 122
-    assert findNext([1, -2, 3, -4]).value == 5
-    assert findNext([1, -2, 4, -8, 16]).value == -32
-    assert findNext([4, 6, 9, 13, 18]).value == 24
-    assert findNext([12, 15, 21, 24, 30]).value == 33
-    assert findNext([1, 1, 2, 3, 5, 8]).value == 13
-    assert findNext([-2, 4, -12, 48, -240]).value == 1440
-    assert findNext([1, 10, 3, 9, 5, 8, 7, 7]).value == 9
-    assert findNext([2, 3, 5, 7, 11, 13, 17, 19]).value == 23
-    assert findNext([200, 196, 180, 116]).value == -140
-    assert findNext([144, 121, 100, 81]).value == 64
-    assert findNext([3, 10, 20, 27, 37]).value == 44
-    assert findNext([80, 10, 70, 15, 60]).value == 20
-    assert findNext([8, 6, 9, 23, 87]).value == 429
-    assert findNext([5, 11, 23, 47]).value == 95
-    assert findNext([7, 13, 24, 45]).value == 86
-    assert findNext([14, 28, 20, 40, 32, 64]).value == 56
-    assert findNext([1, 1, 2, 3, 5]).value in {8, 7}
+    for seq, expected in cases:
+        value = findNext(seq).value
+        if isinstance(expected, set):
+            assert value in expected, (seq, value)
+        else:
+            assert value == expected, (seq, value)
+        # the anytime search ends with the same answer
+        answers = list(search.iterFindNext(seq))
+        assert answers[-1].extra_info["proven"]
+        assert answers[-1].value == value, (seq, answers[-1].value)
     # assert findNext() == 5              # --> 5
     # assert findNext() == 5              # --> 5
+    test_canonical()
+    test_predictor()
+    test_predict()
+    test_parallel()
+    test_long()
+
+
+def test_canonical():
+    """ Check that the canonical cache does not change answers of shifted
+    and scaled cases """
+    search.report = False
+    variants = [[shift + scale * i for i in seq] for seq, expected in cases
+                for shift, scale in ((0, 1), (7, 1), (0, -3), (100, 11))]
+    answers = [findNext(seq, remember=False).value for seq in variants]
+    size = search.canonical_cache.maxsize
+    search.configure(canonical_size=1000)
+    try:
+        for seq, value in zip(variants, answers):
+            assert findNext(seq, remember=False).value == value, seq
+        assert search.canonical_cache.hits > 0
+        # a cached answer does not hide a shallower one of the sequence
+        findNext([0, 1, 3, 5, 9, 11], remember=False)
+        assert findNext([2, 3, 5, 7, 11, 13], remember=False).value == 17
+        findNext([0, -3, -4, -3], remember=False)
+        findNext([0, 3, 4, 3, 4, 0])
+        try:
+            assert findNext([0, 3, 4, 3], remember=False).value == 4
+        finally:
+            search.local_known_sequences.remove([0, 3, 4, 3, 4, 0])
+            search.transposition_table.clear()
+        assert findNext([], remember=False).value is None
+    finally:
+        search.configure(canonical_size=size)
+
+
+def test_predictor():
+    """ Check that cases typed number by number are predicted as well """
+    search.report = False
+    extended = 0
+    for seq, expected in cases:
+        predictor = search.Predictor()
+        for number in seq:
+            value = predictor.append(number).value
+        if isinstance(expected, set):
+            assert value in expected, (seq, value)
+        else:
+            assert value == expected, (seq, value)
+        extended += predictor.extended
+    assert extended > 0
+
+
+def test_predict():
+    """ Check that predicted numbers are the ones that follow """
+    search.report = False
+    for seq, expected in cases:
+        numbers = search.predict(seq, 3, remember=False)
+        assert numbers[0] == findNext(seq, remember=False).value, seq
+    assert findNext([], remember=False).value is None
+    assert search.predict([], 3, remember=False) == []
+    for make in (lambda n: n * n, lambda n: (-2) ** n + n,
+                 lambda n: (-1) ** n * (n * n + 1),
+                 lambda n: 2 ** n if n % 2 else n):
+        seq = [make(n) for n in range(110)]
+        assert search.predict(seq[:10], 100, remember=False) == seq[10:]
+
+
+def test_long():
+    """ Check that a long sequence without an answer is given up quickly,
+    methods must not take time quadratic in its length at every node """
+    search.report = False
+    rnd = random.Random(1001)
+    seq = [rnd.randint(-50, 50) for _ in range(1001)]
+    start = perf_counter()
+    assert findNext(seq, remember=False).value is None
+    # about 0.05 s, it was 15 s when byRecurrence looked for any order
+    assert perf_counter() - start < 1.5, perf_counter() - start
+
+
+def test_parallel():
+    """ Check that searches with workers give the serial answers, with and
+    without the pool """
+    search.report = False
+    old = search.config()
+    serial = [findNext(seq, remember=False).value for seq, _ in hard_cases]
+    try:
+        for min_nodes in (old["parallel_min_nodes"], 10):
+            search.configure(workers=2, parallel_min_nodes=min_nodes)
+            for (seq, _), value in zip(hard_cases, serial):
+                search.transposition_table.clear()
+                assert findNext(seq, remember=False).value == value, seq
+    finally:
+        search.configure(workers=old["workers"],
+                         parallel_min_nodes=old["parallel_min_nodes"])
+        search.transposition_table.clear()
+
+
+def compare_modes():
+    """ Print number of expanded nodes of exhaustive and iterative
+    deepening search for every test case, every search starts with an
+    empty transposition table and no closed forms """
+    search.report = False
+    old = search.config()
+    search.configure(closed_forms=False, adaptive_order=False)
+    print("{:<32}{:>8}{:>12}{:>12}".format(
+        "sequence", "next", "exhaustive", "iterative"))
+    try:
+        for seq, expected in cases:
+            search.iterative_deepening = False
+            search.transposition_table.clear()
+            exhaustive = findNext(seq, remember=False)
+            search.iterative_deepening = True
+            search.transposition_table.clear()
+            iterative = findNext(seq, remember=False)
+            assert exhaustive.value == iterative.value
+            print("{:<32}{:>8}{:>12}{:>12}".format(
+                str(seq), str(exhaustive.value),
+                exhaustive.extra_info["nodes"],
+                iterative.extra_info["nodes"]))
+    finally:
+        search.configure(closed_forms=old["closed_forms"],
+                         adaptive_order=old["adaptive_order"],
+                         iterative_deepening=old["iterative_deepening"])
 
 
 if __name__ == "__main__":
@@ -53,5 +209,5 @@ if __name__ == "__main__":
     start_time = time()
     # test()
     res = findNext(seq)
-    print('\n'.join(res.log_tree.string()))
+    print('\n'.join(res.explain().string()))
     print("Search finished in {}s".format(round(time() - start_time, 3)))
@@ -0,0 +1,97 @@
+"""
+Load generator for server.py
+
+Opens some connections to the prediction service, every connection sends
+requests one after another, and prints latency percentiles.
+Example:
+    python server.py --port 8765 &
+    python loadgen.py --port 8765 --connections 16 --requests 2000
+"""
+import argparse
+import asyncio
+import json
+import random
+from time import perf_counter
+
+from lab import cases
+
+
+def percentile(values, p):
+    """ Return the p-th percentile (0 <= p <= 100) of sorted values """
+    if not values:
+        return None
+    i = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[i]
+
+
+def sequences(count, random_share, seed=0):
+    """ Return count sequences: lab.py cases and random ones """
+    rnd = random.Random(seed)
+    result = []
+    for _ in range(count):
+        if rnd.random() < random_share:
+            size = rnd.randint(4, 8)
+            result.append([rnd.randint(-50, 100) for _ in range(size)])
+        else:
+            result.append(rnd.choice(cases)[0])
+    return result
+
+
+async def client(connect, seqs, latencies, errors, explain):
+    reader, writer = await connect()
+    for i, seq in enumerate(seqs):
+        message = {"id": i, "sequence": seq, "explain": explain}
+        start = perf_counter()
+        writer.write(json.dumps(message).encode() + b"\n")
+        await writer.drain()
+        answer = json.loads(await reader.readline())
+        latencies.append(perf_counter() - start)
+        if "error" in answer:
+            errors.append(answer["error"])
+    writer.close()
+    await writer.wait_closed()
+
+
+async def run(args):
+    if args.unix:
+        def connect():
+            return asyncio.open_unix_connection(args.unix)
+    else:
+        def connect():
+            return asyncio.open_connection(args.host, args.port)
+
+    seqs = sequences(args.requests, args.random, args.seed)
+    share = [seqs[i::args.connections] for i in range(args.connections)]
+    latencies, errors = [], []
+
+    start = perf_counter()
+    await asyncio.gather(*(client(connect, part, latencies, errors,
+                                  args.explain) for part in share))
+    elapsed = perf_counter() - start
+
+    latencies.sort()
+    print("requests:   {}".format(len(latencies)))
+    print("errors:     {}".format(len(errors)))
+    print("throughput: {:.1f} requests/s".format(len(latencies) / elapsed))
+    for p in (50, 90, 99):
+        print("p{}:        {:.2f} ms".format(p, 1000 * percentile(latencies,
+                                                                  p)))
+    print("max:        {:.2f} ms".format(1000 * latencies[-1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="connect to this Unix socket instead")
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--random", type=float, default=0.5,
+                        help="share of random sequences among lab.py cases")
+    parser.add_argument("--explain", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,31 @@
 import search
+from background import BackgroundSearch
 
 from kivy.uix.boxlayout import BoxLayout
 from kivy.app import App
+from kivy.clock import Clock
+
+# seconds to wait after the last keystroke before searching
+typing_delay = 0.3
 
 
 class Zamina(BoxLayout):
-    def take_str(self, text):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        search.report = False
+        self.searcher = BackgroundSearch()
+        self.searcher.start()
+        self.typed = ""
+        self.delayed = Clock.create_trigger(
+            lambda dt: self.take_str(self.typed), typing_delay)
+
+    def type_str(self, text):
+        """ Search text once the user stops typing """
+        self.typed = text
+        self.delayed.cancel()
+        self.delayed()
+
+    def take_str(self, text, remember=False):
         try:
             seq = text.split(',')
             seq = list(int(i)
@@ -14,22 +34,27 @@ class Zamina(BoxLayout):
             self.rtinput.text = "!! Please follow the style 1, 2, 3, 4"
             return False
 
-        search.report = False
         if len(seq) < 2:
             return False
 
-        result = search.findNext(seq)
-        next_number = result.value
-        solution = result.log_tree.string()
+        if remember:
+            self.delayed.cancel()
+        # the result is shown from the Kivy thread
+        self.searcher.request(seq, lambda seq, result: Clock.schedule_once(
+            lambda dt: self.show(result)), remember=remember)
+
+    def show(self, result):
+        solution = result.explain().string()
         self.rtinput.text = '\n'.join(solution)
-        if next_number is None:
-            next_number = ":("
 
 
 class SequencesApp(App):
     def build(self):
         return Zamina()
 
+    def on_stop(self):
+        self.root.searcher.stop()
+
 
 if __name__ == "__main__":
     SequencesApp().run()
@@ -1,18 +1,34 @@
 from __future__ import division, print_function
 
-from itertools import chain
 from seq_repr import *
 from seq_logging import LogTree
-from helper import match_seq
+from math import inf
+from functools import partial
+from time import monotonic, perf_counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import Value
+from seq_cache import TranspositionTable, CanonicalCache
+from fractions import Fraction
+from helper import linear_recurrence
+from seq_db import SequenceDatabase
+from seq_model import compileResult
+from seq_schedule import MethodScheduler
 
 # loading well-known sequences
-from database import known_sequences, WellKnownSequence
+from database import (known_sequences, known_index, WellKnownSequence,
+                      LocalSequences)
 database = known_sequences
 
 
 logformat = "{s} --> {n} \t{c}"
 report = True
-local_known_sequences = []
+local_known_sequences = LocalSequences(max_count=10000,
+                                       max_bytes=16 * 2**20)
+transposition_table = TranspositionTable(maxsize=100000)
+# answers shared by shifted and scaled sequences, off by default
+canonical_cache = CanonicalCache(maxsize=0)
+# SequenceDatabase of imported sequences (see configure) or None
+known_database = None
 
 
 class SearchResult:
@@ -20,257 +36,348 @@ class SearchResult:
     Attributes:
         value: (number) the predicted value
         depth: (number) roughly number of "steps" of solution
-        log_tree: (LogTree) object that contain the way to reach the result
+        need: (number) the solution is reachable with any depth_limit
+              greater than this
+        method: (function) the search method that found the value
+        steps: a tuple of (sequence, comment, result) for each derived
+               sequence the method looked at. result is None when the
+               value was found without searching the sequence.
         extra_info: (dict) containing some extra info
     """
 
-    def __init__(self, value, depth=0, method=None,
-                 extra_info=None, log_tree=LogTree()):
+    def __init__(self, value, depth=0, method=None, need=0,
+                 extra_info=None, steps=()):
         self.value = value
         self.depth = depth
+        self.need = need
+        self.method = method
+        self.steps = steps
         self.extra_info = extra_info
-        self.log_tree = log_tree
+
+    def explain(self):
+        """ Return a LogTree of the way to reach the result """
+        log_tree = LogTree()
+        for seq, comment, result in self.steps:
+            if callable(comment):
+                comment = comment()
+            value = self.value if result is None else result.value
+            log = logformat.format(s=seq.readable(), n=value, c=comment)
+            log_tree.add_child(log)
+            if result is not None:
+                log_tree.add_child(result.explain())
+        return log_tree
 
     def __repr__(self):
         return "<SearchResult value={}, depth={}>".format(self.value,
                                                           self.depth)
 
 
-def byLookUp(seq, depth_limit):
+# returned by methods that do not consider the sequence
+REJECTED = SearchResult(None)
+
+
+class SearchInterrupted(Exception):
+    """ Raised when a search is stopped before it has finished """
+
+
+class SearchTimeout(SearchInterrupted):
+    """ Raised when a search passes its deadline """
+
+
+class SearchCancelled(SearchInterrupted):
+    """ Raised when a search is cancelled """
+
+
+class SearchNodeLimit(SearchInterrupted):
+    """ Raised when a search expands more sequences than allowed """
+
+
+class SearchState:
+    """ Bookkeeping of the running search
+    Attributes:
+        nodes: number of expanded sequences
+        cut: whether some solution was cut off by max_depth
+        deadline: (number) time.monotonic() time to give up at or None
+        cancel: an object with is_set() method (like threading.Event),
+                the search stops when it is set
+        max_nodes: (number) maximum number of expanded sequences or None
+        limited: whether check() should be called for every node
+        expanded: dict of method name --> number of sequences it expanded
+                  ("findNext" for the searched sequence)
+        method: name of the method that searches the current sequence
+        profile: dict of method name --> counters (see profiledCall) or
+                 None if the search is not profiled
+        level: number of method calls in progress (when profiled)
+        hints: results the running method found before for the sequences
+               it searches, in the order it searches them, or None
+               (see extendResult)
+    """
+
+    def __init__(self, deadline=None, cancel=None, max_nodes=None,
+                 profile=False):
+        self.profile = {} if profile else None
+        self.level = 0
+        self.nodes = 0
+        self.expanded = {}
+        self.method = "findNext"
+        self.cut = False
+        self.deadline = deadline
+        self.cancel = cancel
+        self.max_nodes = max_nodes
+        self.limited = (deadline is not None or cancel is not None or
+                        max_nodes is not None)
+        self.hints = None
+
+    def check(self):
+        """ Raise SearchInterrupted if the search should stop """
+        if self.deadline is not None and monotonic() > self.deadline:
+            raise SearchTimeout("search passed its deadline")
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise SearchNodeLimit("search expanded too many sequences")
+        if self.cancel is not None and self.cancel.is_set():
+            raise SearchCancelled("search was cancelled")
+
+
+state = SearchState()
+
+
+def matchComment(matching_seq):
+    if matching_seq.name:
+        return "match with {} ({})".format(matching_seq.name,
+                                           matching_seq.readable()[:15])
+    return "match with {}".format(matching_seq.readable()[:15])
+
+
+def byLookUp(seq, depth_limit, max_depth=inf):
     # predict by matching to sequences in database (known_sequences)
+    if max_depth < 1:
+        state.cut = True
+        return SearchResult(None)
 
-    match_size, next_number, matching_seq = 0, None, None
-    for s in chain(local_known_sequences, database):
-        size, number = match_seq(seq, s)
+    match_size, next_number, matching_seq = local_known_sequences.match(seq)
+    size, number, s = known_index.match(seq)
+    if size > match_size:
+        match_size, next_number, matching_seq = size, number, s
+    if known_database is not None:
+        size, number, s = known_database.match(seq)
         if size > match_size:
-            next_number = number
-            match_size = size
-            matching_seq = s
+            match_size, next_number, matching_seq = size, number, s
 
     if not matching_seq or match_size < matching_seq.familiarity:
         return SearchResult(None)
 
-    # create log tree
-    c = "match with {}".format(matching_seq.readable()[:15], match_size)
-    log = logformat.format(s=seq.readable(), n=next_number, c=c)
-    log_tree = LogTree()
-    log_tree.add_child(log)
-
     extra_info = {"matching sequence": matching_seq}
     return SearchResult(value=next_number,
                         depth=1,
-                        log_tree=log_tree,
+                        need=-1,
+                        method=byLookUp,
+                        steps=((seq, partial(matchComment, matching_seq),
+                                None),),
                         extra_info=extra_info)
 
 
-def byAlter(seq, depth_limit):
+def byAlter(seq, depth_limit, max_depth=inf):
     # predict by looking numbers in even and odd positions seperately
     ar = AlterRepr.convert(seq)
 
-    result_evens = recursiveFindNext(ar.evens, min(depth_limit / 2, 2))
+    result_evens = recursiveFindNext(ar.evens, min(depth_limit / 2, 2),
+                                     max_depth - 1)
     next_even, depth1 = result_evens.value, result_evens.depth
     if next_even is None:
         return SearchResult(None)
 
-    result_odds = recursiveFindNext(ar.odds, min(depth_limit / 2, 2))
+    result_odds = recursiveFindNext(ar.odds, min(depth_limit / 2, 2),
+                                    max_depth - 1)
     next_odd, depth2 = result_odds.value, result_odds.depth
     if next_odd is None:
         return SearchResult(None)
 
-    # create log tree
-    log_tree = LogTree()
-
-    log = logformat.format(s=ar.evens.readable(),
-                           n=next_even,
-                           c="even positions")
-    log_tree.add_child(log)
-    log_tree.add_child(result_evens.log_tree)
-
-    log = logformat.format(s=ar.odds.readable(), n=next_odd, c="odd position")
-    log_tree.add_child(log)
-    log_tree.add_child(result_odds.log_tree)
-
-    # appending new predicted number
+    # the next number is at an even position if there are as many evens
+    # as odds
     if len(ar.evens) == len(ar.odds):
-        ar.evens.append(next_even)
+        value = next_even
     else:
-        ar.odds.append(next_odd)
+        value = next_odd
 
-    value = ar.toNormal()[-1]
     depth = max(depth1, depth2)
-    result = SearchResult(value=value,
-                          depth=depth + 1,
-                          log_tree=log_tree)
-    return result
+    steps = ((ar.evens, "even positions", result_evens),
+             (ar.odds, "odd position", result_odds))
+    return SearchResult(value=value,
+                        depth=depth + 1,
+                        need=2 * max(result_evens.need, result_odds.need),
+                        method=byAlter,
+                        steps=steps)
 
 
-def byDivMod(seq, depth_limit):
+def byDivMod(seq, depth_limit, max_depth=inf):
     # predict by looking at divs and mods (of sucessive terms) seperately
     if not DivModRepr.isConsidering(seq):
-        return SearchResult(None)
+        return REJECTED
 
     dm = DivModRepr(seq)
 
-    result_divs = recursiveFindNext(dm.divs, min(depth_limit / 2, 2))
+    result_divs = recursiveFindNext(dm.divs, min(depth_limit / 2, 2),
+                                    max_depth - 1)
     next_div, depth1 = result_divs.value, result_divs.depth
     if next_div is None:
         return SearchResult(None)
 
-    result_mods = recursiveFindNext(dm.mods, min(depth_limit / 2, 2))
+    result_mods = recursiveFindNext(dm.mods, min(depth_limit / 2, 2),
+                                    max_depth - 1)
     next_mod, depth2 = result_mods.value, result_mods.depth
     if next_mod is None:
         return SearchResult(None)
 
-    # create log tree
-    log_tree = LogTree()
-
-    log = logformat.format(s=dm.divs.readable(), n=next_div, c="taking divs")
-    log_tree.add_child(log)
-    log_tree.add_child(result_divs.log_tree)
-
-    log = logformat.format(s=dm.mods.readable(), n=next_mod, c="taking mods")
-    log_tree.add_child(log)
-    log_tree.add_child(result_mods.log_tree)
-
-    # appending new numbers
-    dm.divs.append(next_div)
-    dm.mods.append(next_mod)
-    value = dm.toNormal()[-1]
+    value = seq[-1] * next_div + next_mod
     depth = max(depth1, depth2)
+    steps = ((dm.divs, "taking divs", result_divs),
+             (dm.mods, "taking mods", result_mods))
     return SearchResult(value=value,
                         depth=1 + depth,
-                        log_tree=log_tree)
+                        need=2 * max(result_divs.need, result_mods.need),
+                        method=byDivMod,
+                        steps=steps)
 
 
-def byDivMod2(seq, depth_limit):
+def byDivMod2(seq, depth_limit, max_depth=inf):
     """Predict by looking at divs2 and mods2 (of sucessive terms)
     seperately """
     if not DivModRepr2.isConsidering(seq):
-        return SearchResult(None)
+        return REJECTED
 
     dm = DivModRepr2(seq)
 
-    result_divs = recursiveFindNext(dm.divs, min(depth_limit / 2, 2))
+    result_divs = recursiveFindNext(dm.divs, min(depth_limit / 2, 2),
+                                    max_depth - 1)
     next_div, depth1 = result_divs.value, result_divs.depth
     if next_div is None:
         return SearchResult(None)
 
-    result_mods = recursiveFindNext(dm.mods, min(depth_limit / 2, 2))
+    result_mods = recursiveFindNext(dm.mods, min(depth_limit / 2, 2),
+                                    max_depth - 1)
     next_mod, depth2 = result_mods.value, result_mods.depth
     if next_mod is None:
         return SearchResult(None)
 
-    # creating log tree
-    log_tree = LogTree()
-
-    log = logformat.format(s=dm.divs.readable(), n=next_div, c="taking divs")
-    log_tree.add_child(log)
-    log_tree.add_child(result_divs.log_tree)
-
-    log = logformat.format(s=dm.mods.readable(), n=next_mod, c="taking mods")
-    log_tree.add_child(log)
-    log_tree.add_child(result_mods.log_tree)
-
-    # appending new numbers
-    dm.divs.append(next_div)
-    dm.mods.append(next_mod)
-    value = dm.toNormal()[-1]
+    value = seq[-1] * next_div + next_mod
     depth = max(depth1, depth2)
+    steps = ((dm.divs, "taking divs", result_divs),
+             (dm.mods, "taking mods", result_mods))
     return SearchResult(value=value,
                         depth=1 + depth,
-                        log_tree=log_tree)
+                        need=2 * max(result_divs.need, result_mods.need),
+                        method=byDivMod2,
+                        steps=steps)
 
 
-def byDiff(seq, depth_limit):
+def byDiff(seq, depth_limit, max_depth=inf):
     """ predict by considering differences """
     d = DiffRepr.convert(seq)
-    result = recursiveFindNext(d.differences, depth_limit)
+    result = recursiveFindNext(d.differences, depth_limit, max_depth - 1)
     next_difference, depth = result.value, result.depth
 
     if next_difference is None:
         return SearchResult(None)
 
-    # creating log tree
-    log = logformat.format(s=d.differences.readable(),
-                           n=next_difference,
-                           c="taking differences")
-    log_tree = LogTree()
-    log_tree.add_child(log)
-    log_tree.add_child(result.log_tree)
-
-    # appending new numbers
-    d.differences.append(next_difference)
-
-    return SearchResult(value=d.toNormal()[-1],
+    return SearchResult(value=seq[-1] + next_difference,
                         depth=depth + 1,
-                        log_tree=log_tree)
+                        need=result.need,
+                        method=byDiff,
+                        steps=((d.differences, "taking differences",
+                                result),))
 
 
-def byRatio(seq, depth_limit):
+def byRatio(seq, depth_limit, max_depth=inf):
     """ predict by considering ratios of sucessive terms"""
     if not RatioRepr.isConsidering(seq):
-        return SearchResult(None)
+        return REJECTED
 
     rr = RatioRepr.convert(seq)
-    result = recursiveFindNext(rr.ratios, depth_limit)
+    result = recursiveFindNext(rr.ratios, depth_limit, max_depth - 1)
     next_ratio, depth = result.value, result.depth
     if next_ratio is None:
         return SearchResult(None)
 
-    # create log_tree
-    log_tree = LogTree()
-    log = logformat.format(s=rr.ratios.readable(),
-                           n=next_ratio,
-                           c="taking ratios")
-    log_tree.add_child(log)
-    log_tree.add_child(result.log_tree)
-
-    # appending new numbers
-    rr.ratios.append(next_ratio)
-    return SearchResult(value=rr.toNormal()[-1],
+    return SearchResult(value=seq[-1] * next_ratio,
                         depth=depth + 1,
-                        log_tree=log_tree)
+                        need=result.need,
+                        method=byRatio,
+                        steps=((rr.ratios, "taking ratios", result),))
 
 
-def byAbs(seq, depth_limit):
+def byAbs(seq, depth_limit, max_depth=inf):
     """Predict by considering absolute values and signs seperately."""
 
     # if all numbers are positive then abort this search
     # (because it causes infinite recursion)
     if not AbsRepr.isConsidering(seq):
-        return SearchResult(None)  # pretend to fail
+        return REJECTED  # pretend to fail
 
     abs_seq = AbsRepr.convert(seq)
 
-    result_values = recursiveFindNext(abs_seq.values, depth_limit)
+    result_values = recursiveFindNext(abs_seq.values, depth_limit,
+                                      max_depth - 1)
     if result_values.value is None:
         return SearchResult(None)
 
-    result_signs = recursiveFindNext(abs_seq.signs, min(depth_limit / 2, 2))
+    result_signs = recursiveFindNext(abs_seq.signs, min(depth_limit / 2, 2),
+                                     max_depth - 1)
     if result_signs.value is None:
         return SearchResult(None)
 
-    # create log tree
-    log_tree = LogTree()
-
-    log = logformat.format(s=abs_seq.values.readable(),
-                           n=result_values.value,
-                           c="taking absolute values")
-
-    log_tree.add_child(log)
-    log_tree.add_child(result_values.log_tree)
-
-    log = logformat.format(s=abs_seq.signs.readable(),
-                           n=result_signs.value,
-                           c="taking signs")
-    log_tree.add_child(log)
-    log_tree.add_child(result_signs.log_tree)
-
     next_number = result_signs.value * result_values.value
     depth = 1 + max(result_values.depth, result_signs.depth)
+    need = max(result_values.need, 2 * result_signs.need)
+    steps = ((abs_seq.values, "taking absolute values", result_values),
+             (abs_seq.signs, "taking signs", result_signs))
     return SearchResult(value=next_number,
                         depth=depth,
-                        log_tree=log_tree)
+                        need=need,
+                        method=byAbs,
+                        steps=steps)
+
+
+def recurrenceComment(coefficients):
+    terms = []
+    for i, c in enumerate(coefficients, 1):
+        if c:
+            factor = "" if abs(c) == 1 else "{}*".format(abs(c))
+            terms.append("{} {}a(n-{})".format("-" if c < 0 else "+",
+                                               factor, i))
+    formula = " ".join(terms)
+    if formula.startswith("+ "):
+        formula = formula[2:]
+    return "a(n) = {}".format(formula)
+
+
+def byRecurrence(seq, depth_limit, max_depth=inf):
+    """ Predict by the shortest linear recurrence with rational
+    coefficients, its order is the depth """
+    if max_depth < 1:
+        state.cut = True
+        return SearchResult(None)
+    if len(seq) < 4 or not features(seq).all_int:
+        return REJECTED
+
+    coefficients = linear_recurrence(seq.numbers,
+                                     max_order=max_recurrence_order)
+    if not coefficients:
+        return SearchResult(None)
+    if len(coefficients) > max_depth:
+        state.cut = True
+        return SearchResult(None)
+
+    value = sum(c * seq[-i] for i, c in enumerate(coefficients, 1))
+    if value.denominator != 1:
+        return SearchResult(None)
+
+    return SearchResult(value=int(value),
+                        depth=len(coefficients),
+                        need=-1,
+                        method=byRecurrence,
+                        steps=((seq, partial(recurrenceComment,
+                                             coefficients), None),),
+                        extra_info={"coefficients": coefficients})
 
 
 # all search functions
@@ -280,10 +387,86 @@ search_methodes = (byLookUp,
                    byDivMod,
                    byAlter,
                    byAbs,
-                   byDivMod2)
+                   byDivMod2,
+                   byRecurrence)
+
+# what a method's isConsidering asks of a sequence, in terms of its
+# seq_schedule.SequenceKey, methods not considering it are not tried
+method_considering = {
+    "byDivMod": lambda key: key.numbers == "int",
+    "byDivMod2": lambda key: key.numbers == "int",
+    "byAbs": lambda key: key.sign in ("alternating", "negative"),
+    "byRecurrence": lambda key: (key.length == "long" and
+                                 key.numbers != "other"),
+}
+# try the methods that won most often for similar sequences first, after
+# looking up (nothing is shallower than a match and it searches no further),
+# off by default as it makes the work of a search depend on earlier ones
+adaptive_order = False
+method_scheduler = MethodScheduler(search_methodes, method_considering,
+                                   first=("byLookUp",))
+# search_methodes with their ranks, the fixed order
+fixed_order = tuple(enumerate(search_methodes))
+
+
+def profiledCall(f, seq, depth_limit, max_depth):
+    """ Call search method f and count in state.profile[f.__name__]:
+    calls, rejected (by isConsidering), successes, time (seconds,
+    including the methods called by f) and deepest (level of the deepest
+    call of f, the searched sequence is searched at level 1)
+    """
+    counters = state.profile.get(f.__name__)
+    if counters is None:
+        counters = state.profile[f.__name__] = dict.fromkeys(
+            ("calls", "rejected", "successes", "time", "deepest"), 0)
+    state.level += 1
+    counters["deepest"] = max(counters["deepest"], state.level)
+    start = perf_counter()
+    try:
+        result = f(seq, depth_limit=depth_limit, max_depth=max_depth)
+    finally:
+        state.level -= 1
+        counters["time"] += perf_counter() - start
+        counters["calls"] += 1
+    if result is REJECTED:
+        counters["rejected"] += 1
+    elif result.value is not None:
+        counters["successes"] += 1
+    return result
+
 
+# counters of all profiled searches of this process (see profileTotals)
+profile_totals = {}
+
+
+def mergeProfile(profile, totals=None):
+    """ Add the counters of profile (like extra_info["profile"]) to totals,
+    profile_totals by default """
+    if totals is None:
+        totals = profile_totals
+    for name, counters in profile.items():
+        total = totals.setdefault(name, dict.fromkeys(counters, 0))
+        for key, value in counters.items():
+            if key == "deepest":
+                total[key] = max(total[key], value)
+            else:
+                total[key] += value
+
+
+def profileTotals():
+    """ Return a copy of counters of all profiled searches """
+    return {name: dict(counters) for name, counters in profile_totals.items()}
+
+
+def resetProfile():
+    profile_totals.clear()
+
+
+def recursiveFindNext(seq, depth_limit, max_depth=inf):
+    """ Search for the shallowest solution not deeper than max_depth """
+    if state.hints:
+        return hintedFindNext(seq, depth_limit, max_depth)
 
-def recursiveFindNext(seq, depth_limit):
     # cut off when reached depth limit
     if depth_limit <= 0:
         return SearchResult(None)
@@ -292,46 +475,741 @@ def recursiveFindNext(seq, depth_limit):
     if len(seq) < 2:
         return SearchResult(None)
 
+    # cut off when no solution can be shallow enough
+    if max_depth < 0:
+        state.cut = True
+        return SearchResult(None)
+
     # if sequence is constant
     if seq.is_constant():
         return SearchResult(value=seq[0])
 
-    answers = []  # a list of (possible_next_number, depth)
-    for f in search_methodes:
-        result = f(seq, depth_limit=depth_limit - 1)
+    # if the sequence was already searched deep enough
+    key = seq.numbers
+    known = transposition_table.get(key, depth_limit, max_depth)
+    if known is not None:
+        result, cut = known
+        state.cut = state.cut or cut
+        return result or SearchResult(None)
+
+    state.nodes += 1
+    caller = state.method
+    state.expanded[caller] = state.expanded.get(caller, 0) + 1
+    if state.limited:
+        state.check()
+    outer_cut, state.cut = state.cut, False
+
+    # branch and bound: every next answer has to be shallower than the best
+    # or as shallow and found by a method ranked before it
+    best, best_rank = SearchResult(None, depth=max_depth + 1), -1
+    order = method_scheduler.order(seq) if adaptive_order else fixed_order
+    for rank, f in order:
+        # a method's own step costs at least 1
+        bound = best.depth - 2 if rank > best_rank else best.depth - 1
+        if bound < 1:
+            state.cut = True
+            continue
+
+        state.method = f.__name__
+        if state.profile is None:
+            result = f(seq, depth_limit=depth_limit - 1, max_depth=bound)
+        else:
+            result = profiledCall(f, seq, depth_limit - 1, bound)
         if result.value is not None:
             result.depth += 1
-            answers.append(result)
+            result.need += 1
+            best, best_rank = result, rank
+    state.method = caller
+
+    if best.value is not None:
+        # cut off branches could not win anyway
+        transposition_table.put(key, depth_limit, max_depth, best)
+        state.cut = outer_cut
+        return best
+
+    result = SearchResult(None)
+    if state.cut:
+        transposition_table.put(key, depth_limit, max_depth, result)
+    else:
+        transposition_table.put(key, depth_limit, inf, result)
+    state.cut = state.cut or outer_cut
+    return result
 
-            # can be sometimes helpful
-            # if result.depth <= depth_limit:
-            #     break
 
-    # choose a result with minimum depth
-    if not answers:
-        return SearchResult(None)
+def extendResult(result, seq, depth_limit):
+    """ Return the result of applying the derivation of result, found for
+    a sequence seq starts with, to seq, or None if it does not hold.
+    Sequences below that the derivation does not explain any more are
+    searched again, the others only replay their derivation. Like
+    recursiveFindNext(seq, depth_limit) the result is reachable with
+    depth_limit, but a shallower one may exist.
+    """
+    if depth_limit <= 0 or len(seq) < 2:
+        return None
+    if result.method is None:
+        # only constants, other results without a method can not be
+        # replayed
+        if not result.steps and seq.is_constant():
+            return SearchResult(value=seq[0])
+        return None
+
+    outer_hints = state.hints
+    state.hints = [result for _, _, result in result.steps]
+    try:
+        extended = result.method(seq, depth_limit=depth_limit - 1)
+    finally:
+        state.hints = outer_hints
+    if extended.value is None:
+        return None
+    extended.depth += 1
+    extended.need += 1
+    if extended.need >= depth_limit:
+        return None
+    return extended
+
+
+def hintedFindNext(seq, depth_limit, max_depth=inf):
+    # recursiveFindNext called by a method replaying its derivation, the
+    # next hint is the result it found before for this sequence
+    hints = state.hints
+    hint = hints.pop(0)
+    state.hints = None
+    try:
+        result = None
+        if hint is not None:
+            result = extendResult(hint, seq, depth_limit)
+        if result is None:
+            result = recursiveFindNext(seq, depth_limit, max_depth)
+    finally:
+        state.hints = hints
+    return result
+
+
+def iterativeFindNext(seq, depth_limit):
+    """ Same as recursiveFindNext but tries max_depth = 0, 1, 2 ...
+    and stops at the first one that has a solution
+    """
+    max_depth = 0
+    while True:
+        state.cut = False
+        result = recursiveFindNext(seq, depth_limit, max_depth)
 
-    result = min(answers, key=lambda result: result.depth)
+        # stop if found or if nothing was cut off by max_depth
+        if result.value is not None or not state.cut:
+            return result
+        max_depth += 1
+
+
+def polynomialResult(seq, max_degree, depth_limit):
+    """ Return the result of taking differences until they are constant
+    (at least two equal numbers) or None. The result is built as the
+    search builds it, only degrees below depth_limit are reachable there.
+    """
+    if len(seq) < 2:
+        return None
+    levels = [seq]
+    for degree in range(1, min(max_degree, depth_limit - 1) + 1):
+        differences = DiffRepr.convert(levels[-1]).differences
+        if len(differences) < 2:
+            return None
+        if differences.is_constant():
+            break
+        levels.append(differences)
+    else:
+        return None
+
+    result = SearchResult(value=differences[0])
+    for level in reversed(levels):
+        result = SearchResult(value=level[-1] + result.value,
+                              depth=result.depth + 2,
+                              need=result.need + 1,
+                              method=byDiff,
+                              steps=((differences, "taking differences",
+                                      result),))
+        differences = level
     return result
 
 
-depth_limit = 70
+def periodicResult(seq):
+    """ Return the result for seq repeating with its smallest period at
+    least twice or None. It is explained as a match of seq with itself,
+    as byLookUp explains it when seq is remembered.
+    """
+    if len(seq) < 2:
+        return None
+    # prefix function: the longest proper prefix of seq[:i + 1] that is
+    # also its suffix
+    prefix = [0] * len(seq)
+    k = 0
+    for i in range(1, len(seq)):
+        while k and seq[i] != seq[k]:
+            k = prefix[k - 1]
+        if seq[i] == seq[k]:
+            k += 1
+        prefix[i] = k
+
+    period = len(seq) - prefix[-1]
+    if period < 2 or 2 * period > len(seq):
+        return None
+    return SearchResult(value=seq[-period],
+                        depth=2,
+                        need=0,
+                        method=byLookUp,
+                        steps=((seq, partial(matchComment, seq), None),),
+                        extra_info={"matching sequence": seq})
+
+
+def closedForm(seq):
+    """ Return the shallowest of polynomialResult and periodicResult or
+    None. Every result of the search at least as shallow is found quickly
+    by searching with max_depth=result.depth, that search gives the same
+    answer as an unlimited one.
+    """
+    if len(seq) < 2:
+        return None
+    results = [periodicResult(seq),
+               polynomialResult(seq, max_degree, depth_limit)]
+    results = [result for result in results if result is not None]
+    if not results:
+        return None
+    return min(results, key=lambda result: result.depth)
+
+
+def isAffine(result, shift=True):
+    """ Check if the derivation of result gives scale * value for the
+    sequence scale * seq (and also shift + scale * value for
+    shift + scale * seq if shift is True) """
+    if result.method is None:
+        # constant sequence
+        return not result.steps
+    if result.method is byDiff:
+        return isAffine(result.steps[0][2], shift=False)
+    if result.method is byAlter:
+        return all(isAffine(child, shift) for _, _, child in result.steps)
+    if result.method is byRatio:
+        # ratios do not change by scaling
+        return not shift
+    return False
+
+
+def scalingComment(known_seq, seq):
+    # seq == ratio * known_seq + offset
+    _, known_shift, known_scale = CanonicalCache.canonical(known_seq)
+    _, shift, scale = CanonicalCache.canonical(seq)
+    ratio = Fraction(scale, known_scale)
+    offset = shift - ratio * known_shift
+    return "times {} plus {} is {}".format(ratio, offset,
+                                           seq.readable()[:15])
+
+
+def anytimeFindNext(seq, depth_limit, best=None):
+    """ Yield tuples (result, last) of better and better results of seq.
+    The depth limit grows with every pass and a pass only looks for
+    results as shallow as the best one so far. The last pass (last is
+    True) searches with depth_limit, so its result is the one
+    recursiveFindNext(seq, depth_limit) returns, unless best (a result
+    known before, which is yielded first) is shallower.
+    """
+    limits = []
+    limit = 2
+    while limit < depth_limit:
+        limits.append(limit)
+        limit *= 2
+    limits.append(depth_limit)
+
+    if best is None:
+        best = SearchResult(None, depth=inf)
+    else:
+        yield best, False
+    for limit in limits:
+        result = recursiveFindNext(seq, limit, max_depth=best.depth)
+        last = limit == depth_limit
+        if result.value is not None and (result.depth < best.depth or last):
+            best = result
+            yield result, last
+        elif last:
+            yield best if best.value is not None else result, last
+
+
+def subproblems(seq, depth_limit):
+    """ Return (sequence, depth_limit, alone) of every search the methods
+    start for seq when called with depth_limit. alone tells if the method
+    searches only that sequence. """
+    half = min(depth_limit / 2, 2)
+    children = [(DiffRepr.convert(seq).differences, depth_limit, True)]
+    if RatioRepr.isConsidering(seq):
+        children.append((RatioRepr.convert(seq).ratios, depth_limit, True))
+    if DivModRepr.isConsidering(seq):
+        dm = DivModRepr(seq)
+        children.extend([(dm.divs, half, False), (dm.mods, half, False)])
+    ar = AlterRepr.convert(seq)
+    children.extend([(ar.evens, half, False), (ar.odds, half, False)])
+    if AbsRepr.isConsidering(seq):
+        abs_seq = AbsRepr.convert(seq)
+        children.extend([(abs_seq.values, depth_limit, False),
+                         (abs_seq.signs, half, False)])
+    if DivModRepr2.isConsidering(seq):
+        dm = DivModRepr2(seq)
+        children.extend([(dm.divs, half, False), (dm.mods, half, False)])
+    return children
+
+
+def parallelFindNext(seq, depth_limit, workers):
+    """ Same as recursiveFindNext but searches the sequences two steps
+    below seq in a process pool.
+    Results of the pool go to the transposition table, then the usual
+    search of the top two steps finds them there, so the answer is the
+    same as in a serial search. The best depth found so far is shared with
+    the workers when their tasks start, they do not look for anything
+    deeper. Starting the pool costs about as much as expanding some
+    thousand sequences, so the pool is only used for searches that expand
+    more than parallel_min_nodes.
+    """
+    # shallow answers are found faster without the pool
+    result = recursiveFindNext(seq, depth_limit, max_depth=4)
+    if result.value is not None or not state.cut:
+        return result
+
+    # so are small searches
+    caller, limits = state.method, (state.max_nodes, state.limited)
+    budget = state.nodes + parallel_min_nodes
+    state.max_nodes = budget if limits[0] is None else min(budget, limits[0])
+    state.limited = True
+    try:
+        return recursiveFindNext(seq, depth_limit)
+    except SearchNodeLimit:
+        if limits[0] is not None and state.nodes > limits[0]:
+            raise
+        state.method, state.cut = caller, False
+    finally:
+        state.max_nodes, state.limited = limits
+
+    # (sequence, depth_limit, is reached only by single sequence methods)
+    tasks = {}
+    for child, child_limit, alone in subproblems(seq, depth_limit - 1):
+        for task, task_limit, task_alone in subproblems(child,
+                                                        child_limit - 1):
+            if task_limit <= 0 or len(task) < 2 or task.is_constant():
+                continue
+            key = (task, task_limit)
+            single = alone and task_alone
+            if key not in tasks or single:
+                tasks[key] = (task, task_limit, single)
+
+    # biggest tasks first, so that idle workers take the small ones at end
+    tasks = sorted(tasks.values(), key=lambda task: -task[1] * len(task[0]))
+
+    bound = Value("d", inf)
+    remembered = [list(s) for s in local_known_sequences]
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_initWorker,
+                             initargs=(config(), remembered, bound)) as pool:
+        futures = {pool.submit(_searchSubtree, task, task_limit): single
+                   for task, task_limit, single in tasks}
+        for future in as_completed(futures):
+            key, task_limit, max_depth, result = future.result()
+            transposition_table.put(key, task_limit, max_depth, result)
+            if futures[future] and result.value is not None:
+                # two steps of single sequence methods above the task
+                with bound.get_lock():
+                    bound.value = min(bound.value, result.depth + 4)
+
+    return recursiveFindNext(seq, depth_limit, max_depth=bound.value)
 
 
-def findNext(seq):
+depth_limit = 70
+iterative_deepening = False
+workers = 0
+# searches expanding fewer sequences do not use the pool of workers
+parallel_min_nodes = 2000
+# look for polynomial (up to max_degree) and periodic sequences first
+closed_forms = True
+max_degree = 6
+# byRecurrence only looks for recurrences up to this order, longer ones
+# would make it take time quadratic in the length of every sequence
+max_recurrence_order = 8
+# count calls, successes and time of every method (see profiledCall)
+profile = False
+
+
+def findNext(seq, remember=True, deadline=None, max_nodes=None,
+             cancel=None, model=False):
+    """ Predict the next number of seq
+    Arguments:
+        remember: if False seq is forgotten after the search (it is still
+                  known while searching)
+        deadline: time.monotonic() time to stop searching at
+        max_nodes: maximum number of sequences to expand
+        cancel: an object with is_set() method (like threading.Event),
+                SearchCancelled is raised soon after it is set
+        model: if True extra_info["model"] is the seq_model.Model of the
+               result (None if nothing was found)
+    With a deadline or max_nodes the best result found until the budget
+    runs out is returned (see iterFindNext). extra_info["proven"] tells if
+    no shallower result exists within depth_limit.
+    """
+    if model:
+        answer = findNext(seq, remember, deadline, max_nodes, cancel)
+        seq, _, result = answer.steps[0]
+        answer.extra_info["model"] = compileResult(result, seq)
+        return answer
+
+    if deadline is not None or max_nodes is not None:
+        answer = None
+        for answer in iterFindNext(seq, remember, deadline, max_nodes,
+                                   cancel):
+            pass
+        if answer is None:
+            answer = _answer(WellKnownSequence(seq, familiarity=3),
+                             SearchResult(None), proven=False)
+        return answer
+
     # convert to normal
     seq = WellKnownSequence(seq, familiarity=3)
-    local_known_sequences.append(seq)
+
+    # remembered results may rely on the old known sequences
+    added = local_known_sequences.add(seq)
+    if added:
+        transposition_table.clear()
 
     # getting result
-    result = recursiveFindNext(seq, depth_limit)
-    next_number = result.value
+    global state
+    state = SearchState(deadline=deadline, cancel=cancel, profile=profile)
+
+    # a shifted and scaled sequence may have been solved, seq may still
+    # have a shallower answer of its own (like a match)
+    cached = canonical_cache.get(seq, depth_limit)
+    if cached is not None:
+        value, (known_seq, known) = cached
+        comment = partial(scalingComment, known_seq, seq)
+        cached = SearchResult(value, depth=known.depth,
+                              steps=((known_seq, comment, known),))
+
+    try:
+        known = closedForm(seq) if closed_forms else None
+        if cached is not None and (known is None or
+                                   cached.depth < known.depth):
+            known = cached
+        if known is not None:
+            # nothing deeper than the closed form or the cached answer can
+            # win
+            result = recursiveFindNext(seq, depth_limit, known.depth)
+            if result.value is None:
+                result = known
+        elif workers:
+            result = parallelFindNext(seq, depth_limit, workers)
+        elif iterative_deepening:
+            result = iterativeFindNext(seq, depth_limit)
+        else:
+            result = recursiveFindNext(seq, depth_limit)
+    finally:
+        if added and not remember:
+            local_known_sequences.remove(seq)
+            transposition_table.clear()
+        if state.profile is not None:
+            mergeProfile(state.profile)
+    if adaptive_order:
+        method_scheduler.record(seq, result)
+    if (canonical_cache.maxsize and result.value is not None and
+            isAffine(result)):
+        canonical_cache.put(seq, depth_limit, result.value, (seq, result))
+    return _answer(seq, result, proven=True)
+
+
+def iterFindNext(seq, remember=True, deadline=None, max_nodes=None,
+                 cancel=None):
+    """ Yield better and better predictions of seq, arguments are the same
+    as for findNext. Every prediction is shallower than the previous one
+    except the last one, which has extra_info["proven"] True and is the
+    result findNext(seq) gives. When the deadline passes or max_nodes
+    sequences are expanded the generator just stops.
+    Settings iterative_deepening and workers are not used.
+    """
+    seq = WellKnownSequence(seq, familiarity=3)
 
-    # logging
-    log_tree = LogTree()
-    log = logformat.format(s=seq.readable(), n=next_number, c="")
-    log_tree.add_child(log)
-    log_tree.add_child(result.log_tree)
+    added = local_known_sequences.add(seq)
+    if added:
+        transposition_table.clear()
+
+    global state
+    own_state = SearchState(deadline=deadline, cancel=cancel,
+                            max_nodes=max_nodes, profile=profile)
+    known = closedForm(seq) if closed_forms else None
+    results = anytimeFindNext(seq, depth_limit, known)
+    try:
+        while True:
+            # the caller may search something else between predictions
+            state = own_state
+            try:
+                result, proven = next(results)
+            except (StopIteration, SearchTimeout, SearchNodeLimit):
+                return
+            yield _answer(seq, result, proven)
+    finally:
+        if added and not remember:
+            local_known_sequences.remove(seq)
+            transposition_table.clear()
+        if own_state.profile is not None:
+            mergeProfile(own_state.profile)
+
+
+def extendFindNext(answer, seq, remember=True, cancel=None):
+    """ Predict seq by the derivation of answer, the answer of findNext for
+    a sequence seq starts with (see extendResult). Only sequences the
+    derivation does not explain any more are searched.
+    Return the answer like findNext, extra_info["proven"] is False as a
+    shallower result may exist, or None if the derivation does not hold.
+    """
+    seq = WellKnownSequence(seq, familiarity=3)
 
-    # return next number
-    return SearchResult(value=next_number, log_tree=log_tree)
+    added = local_known_sequences.add(seq)
+    if added:
+        transposition_table.clear()
+
+    global state
+    state = SearchState(cancel=cancel, profile=profile)
+    try:
+        result = extendResult(answer.steps[0][2], seq, depth_limit)
+    finally:
+        if added and not remember:
+            local_known_sequences.remove(seq)
+            transposition_table.clear()
+        if state.profile is not None:
+            mergeProfile(state.profile)
+    if result is None:
+        return None
+    return _answer(seq, result, proven=False)
+
+
+class Predictor:
+    """ Predictions of a sequence that grows between them
+    When numbers are appended the previous derivation is tried first (see
+    extendFindNext), so a correctly predicted number costs a replay of the
+    derivation instead of a search. Other sequences are searched by
+    findNext.
+    Attributes:
+        seq: (list) the last predicted sequence
+        answer: its answer (like findNext gives) or None
+        remember: passed to findNext
+        extended: number of answers found by extending the previous one
+        searched: number of answers found by findNext
+    Usage:
+        predictor = Predictor()
+        for number in numbers:
+            answer = predictor.append(number)
+    """
+
+    def __init__(self, remember=False):
+        self.seq = []
+        self.answer = None
+        self.remember = remember
+        self.extended = 0
+        self.searched = 0
+
+    def append(self, number, cancel=None):
+        """ Predict the sequence with number appended """
+        return self.predict(self.seq + [number], cancel)
+
+    def predict(self, seq, cancel=None):
+        """ Predict seq, cheaply if it starts with the last sequence """
+        seq = list(seq)
+        answer = None
+        if (self.answer is not None and len(seq) > len(self.seq) and
+                seq[:len(self.seq)] == self.seq):
+            answer = extendFindNext(self.answer, seq, self.remember, cancel)
+        if answer is None:
+            answer = findNext(seq, self.remember, cancel=cancel)
+            self.searched += 1
+        else:
+            self.extended += 1
+        self.seq, self.answer = seq, answer
+        return answer
+
+
+def predict(seq, k, remember=True):
+    """ Return a list of the next k numbers of seq. It is searched once by
+    findNext, then the seq_model.Model of the winning derivation gives the
+    numbers. Only when the model runs out (like a matched known sequence
+    does) the sequence with the numbers found so far is searched again.
+    The list is shorter if some search finds nothing.
+    """
+    numbers = []
+    while len(numbers) < k:
+        answer = findNext(list(seq) + numbers, remember and not numbers,
+                          model=True)
+        if answer.value is None:
+            break
+        model = answer.extra_info["model"]
+        found = model.take(k - len(numbers)) if model is not None else []
+        numbers.extend(found or [answer.value])
+    return numbers
+
+
+def _answer(seq, result, proven):
+    # return next number, the explanation is built by result.explain()
+    extra_info = {"nodes": state.nodes, "expanded": dict(state.expanded),
+                  "proven": proven}
+    if state.profile is not None:
+        extra_info["profile"] = {name: dict(counters) for name, counters
+                                 in state.profile.items()}
+    return SearchResult(value=result.value, depth=result.depth,
+                        extra_info=extra_info, steps=((seq, "", result),))
+
+
+def config():
+    """ Return the module settings as a dict (see configure) """
+    return {"depth_limit": depth_limit,
+            "iterative_deepening": iterative_deepening,
+            "workers": workers,
+            "parallel_min_nodes": parallel_min_nodes,
+            "closed_forms": closed_forms,
+            "max_degree": max_degree,
+            "profile": profile,
+            "report": report,
+            "transposition_size": transposition_table.maxsize,
+            "canonical_size": canonical_cache.maxsize,
+            "database": known_database and known_database.path,
+            "remember_sequences": local_known_sequences.enabled,
+            "max_remembered": local_known_sequences.max_count,
+            "max_remembered_bytes": local_known_sequences.max_bytes,
+            "adaptive_order": adaptive_order,
+            "method_priors": method_scheduler.path}
+
+
+def configure(depth_limit=None, iterative_deepening=None, workers=None,
+              closed_forms=None, max_degree=None, profile=None, report=None,
+              transposition_size=None, canonical_size=None, database=None,
+              remember_sequences=None, max_remembered=None,
+              max_remembered_bytes=None, adaptive_order=None,
+              method_priors=None, parallel_min_nodes=None):
+    """ Change the module settings, None arguments are left unchanged
+    database is the path of a file written by seq_db.py, "" closes it.
+    method_priors is the path of wins of methods (see seq_schedule.py) to
+    load, method_scheduler.save() writes them back there.
+    """
+    settings = globals()
+    if depth_limit is not None:
+        settings["depth_limit"] = depth_limit
+    if iterative_deepening is not None:
+        settings["iterative_deepening"] = iterative_deepening
+    if workers is not None:
+        settings["workers"] = workers
+    if parallel_min_nodes is not None:
+        settings["parallel_min_nodes"] = parallel_min_nodes
+    if closed_forms is not None:
+        settings["closed_forms"] = closed_forms
+    if max_degree is not None:
+        settings["max_degree"] = max_degree
+    if profile is not None:
+        settings["profile"] = profile
+    if report is not None:
+        settings["report"] = report
+    if transposition_size is not None:
+        transposition_table.maxsize = transposition_size
+    if canonical_size is not None:
+        canonical_cache.maxsize = canonical_size
+        canonical_cache.clear()
+    if database is not None:
+        if known_database is not None:
+            known_database.close()
+        settings["known_database"] = (SequenceDatabase(database)
+                                      if database else None)
+        # remembered results may rely on the old known sequences
+        transposition_table.clear()
+        canonical_cache.clear()
+    if remember_sequences is not None:
+        local_known_sequences.enabled = remember_sequences
+    if max_remembered is not None:
+        local_known_sequences.max_count = max_remembered
+    if max_remembered_bytes is not None:
+        local_known_sequences.max_bytes = max_remembered_bytes
+    if adaptive_order is not None:
+        settings["adaptive_order"] = adaptive_order
+    if method_priors is not None:
+        method_scheduler.load(method_priors)
+
+
+def _initWorker(settings, sequences, bound=None):
+    # a worker process starts with the settings and the memory of the parent
+    configure(**settings)
+    settings = globals()
+    settings["workers"] = 0
+    settings["shared_bound"] = bound
+    for seq in sequences:
+        local_known_sequences.add(WellKnownSequence(seq, familiarity=3))
+    transposition_table.clear()
+
+
+# best depth found by all processes of parallelFindNext
+shared_bound = None
+
+
+def _searchSubtree(seq, depth_limit):
+    # search a sequence two steps below the top one in parallelFindNext
+    global state
+    state = SearchState()
+    max_depth = shared_bound.value - 4
+    result = recursiveFindNext(seq, depth_limit, max_depth)
+    if result.value is None and not state.cut:
+        max_depth = inf
+    return seq, depth_limit, max_depth, result
+
+
+def _findChunk(chunk, timeout, explain):
+    # search every (index, seq) of chunk, errors are kept per sequence
+    results = []
+    for i, seq in chunk:
+        try:
+            deadline = None if timeout is None else monotonic() + timeout
+            result = findNext(seq, remember=False, deadline=deadline)
+            if not explain:
+                result = SearchResult(value=result.value, depth=result.depth,
+                                      extra_info=result.extra_info)
+            results.append((i, result))
+        except Exception as error:
+            results.append((i, error))
+    return results
+
+
+def findNextMany(sequences, workers=None, chunksize=1, timeout=None,
+                 explain=False, ordered=True):
+    """ Predict next numbers of many sequences using a process pool
+    Every sequence is searched as findNext(seq, remember=False) would do
+    in a process that knows the sequences this one remembers.
+
+    Arguments:
+        workers: number of processes (default: number of cpus),
+                 0 searches in this process
+        chunksize: number of sequences sent to a process at once
+        timeout: seconds allowed for every single sequence, then the best
+                 result found is given (see findNext)
+        explain: if False results only have value, depth and extra_info
+        ordered: if False results are given as they are completed
+    Yields tuples (index of sequence, SearchResult or the raised exception)
+    """
+    items = list(enumerate(sequences))
+    chunks = [items[i:i + chunksize] for i in range(0, len(items), chunksize)]
+
+    if workers == 0:
+        for chunk in chunks:
+            yield from _findChunk(chunk, timeout, explain)
+        return
+
+    remembered = [list(seq) for seq in local_known_sequences]
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_initWorker,
+                             initargs=(config(), remembered)) as pool:
+        futures = [pool.submit(_findChunk, chunk, timeout, explain)
+                   for chunk in chunks]
+        try:
+            for future in (futures if ordered else as_completed(futures)):
+                for i, result in future.result():
+                    # counters of the workers are added to this process
+                    if (isinstance(result, SearchResult) and
+                            "profile" in result.extra_info):
+                        mergeProfile(result.extra_info["profile"])
+                    yield i, result
+        finally:
+            # when the caller stops early
+            for future in futures:
+                future.cancel()
@@ -0,0 +1,165 @@
+"""
+Caches used by the search
+
+TranspositionTable: remembers solved (and unsolvable) sequences together
+                    with the depth limit they were searched with
+CanonicalCache: remembers answers of sequences up to shifting and scaling
+"""
+from collections import OrderedDict
+from math import gcd
+
+
+class TranspositionTable:
+    """ Bounded memo table for recursiveFindNext
+    A success found with depth limit L answers every query with a limit in
+    (result.need, L]: the winning derivation is still reachable there and
+    nothing shallower can appear with a smaller limit. If the query only
+    accepts results shallower than result.depth, it is a failure.
+    A failure found with depth limit L and maximum depth D answers every
+    query with a limit <= L and a maximum depth <= D.
+
+    Attributes:
+        maxsize: maximum number of remembered sequences (0 disables the table)
+        hits, misses: lookup counters
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        # key --> [result, limit of result, limit of failure,
+        #          max_depth of failure]
+        self.entries = OrderedDict()
+
+    def get(self, key, depth_limit, max_depth):
+        """ Return None if the answer is unknown, otherwise a tuple
+        (result, cut) where result is None for failures and cut tells if
+        the failure is only caused by max_depth
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            result, found_limit, failed_limit, failed_depth = entry
+            if depth_limit <= failed_limit and max_depth <= failed_depth:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return None, failed_depth != float("inf")
+            if (result is not None and
+                    result.need < depth_limit <= found_limit):
+                self.hits += 1
+                self.entries.move_to_end(key)
+                if result.depth > max_depth:
+                    return None, True
+                return result, False
+        self.misses += 1
+        return None
+
+    def put(self, key, depth_limit, max_depth, result):
+        """ Remember the result of searching key with depth_limit.
+        For failures max_depth should be infinite if the search was not cut
+        off by it.
+        """
+        if self.maxsize <= 0:
+            return
+
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = [None, 0, 0, -1]
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        else:
+            self.entries.move_to_end(key)
+
+        if result.value is None:
+            # unless the old failure covers the new one, keep the newest
+            if depth_limit > entry[2] or max_depth > entry[3]:
+                entry[2], entry[3] = depth_limit, max_depth
+        elif depth_limit >= entry[1]:
+            entry[0], entry[1] = result, depth_limit
+
+    def clear(self):
+        """ Forget everything (e.g. when known sequences have changed) """
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return "<TranspositionTable size={}, hits={}, misses={}>".format(
+            len(self), self.hits, self.misses)
+
+
+class CanonicalCache:
+    """ Bounded cache of answers shared by sequences that only differ by
+    shifting and scaling: seq and shift + scale * seq have the same key.
+    Only answers that shift and scale the same way (see search) should be
+    stored.
+    Attributes:
+        maxsize: maximum number of remembered answers (0 disables the cache)
+        hits, misses: lookup counters
+    """
+
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        # (canonical sequence, depth limit) --> (normalized answer, stored)
+        self.entries = OrderedDict()
+
+    @staticmethod
+    def canonical(seq):
+        """ Return (canonical sequence, shift, scale) such that
+        seq[i] == shift + scale * canonical[i], or None for empty,
+        constant or not integer sequences.
+        The canonical sequence starts with 0 and its first other number is
+        positive, the gcd of its numbers is 1.
+        """
+        if not seq or any(type(i) is not int for i in seq):
+            return None
+        shift = seq[0]
+        scale = 0
+        for i in seq:
+            scale = gcd(scale, i - shift)
+        if scale == 0:
+            return None
+        if next(i for i in seq if i != shift) < shift:
+            scale = -scale
+        return tuple((i - shift) // scale for i in seq), shift, scale
+
+    def get(self, seq, depth_limit):
+        """ Return (answer, stored) where answer is the next number of seq
+        and stored is what was given to put, or None """
+        if self.maxsize <= 0:
+            return None
+        canonical = self.canonical(seq)
+        entry = canonical and self.entries.get((canonical[0], depth_limit))
+        if not entry:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end((canonical[0], depth_limit))
+        key, shift, scale = canonical
+        normalized, stored = entry
+        return shift + scale * normalized, stored
+
+    def put(self, seq, depth_limit, answer, stored):
+        """ Remember answer of seq together with anything stored """
+        canonical = self.canonical(seq)
+        if self.maxsize <= 0 or canonical is None:
+            return
+        key, shift, scale = canonical
+        if (answer - shift) % scale:
+            return
+        self.entries[(key, depth_limit)] = ((answer - shift) // scale, stored)
+        self.entries.move_to_end((key, depth_limit))
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return "<CanonicalCache size={}, hits={}, misses={}>".format(
+            len(self), self.hits, self.misses)
@@ -0,0 +1,347 @@
+"""
+Known sequences stored in a file
+
+The file is read through mmap, so opening it takes no time, nothing is
+loaded before it is needed and processes using the same file share its
+pages. Numbers are int64 in the byte order of the machine that wrote it.
+    header       magic, byte order, number of sequences, numbers and
+                 index entries
+    starts       uint64 * (sequences + 1): where sequences start in numbers
+    numbers      int64 * numbers: all sequences one after another
+    names        uint32 * sequences: OEIS A-numbers (0 if unknown)
+    familiarity  uint8 * sequences (padded to 8 bytes)
+    keys         uint64 * entries: sorted tripleKey of successive triples
+    places       uint64 * entries: id << 32 | position of the last number
+                 of the triple, for the triple at the same index in keys
+    long keys    uint64 * long entries: sorted longKey of successive LONG
+                 numbers
+    long places  uint64 * long entries: places of the long keys
+A lookup first tries the long keys, only sequences matching the last LONG
+numbers are compared there. Triples like 1, 2, 3 are shared by thousands
+of sequences, they are only compared when nothing matches that long and at
+most MAX_CANDIDATES of them, find() tells when that missed some.
+
+Import OEIS "stripped" files (lines like "A000045 ,0,1,1,2,3,5,8,")
+and b-files (lines "n a(n)", named like b000045.txt):
+    python seq_db.py sequences.db stripped.gz b000045.txt ...
+"""
+import argparse
+import gzip
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+
+from database import WellKnownSequence
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAGIC = b"SEQDB\x00\x02\x00"
+HEADER = struct.Struct("=8s8sQQQQ")
+MASK = 2**64 - 1
+INT64 = 2**63
+# numbers of the long keys (two triples)
+LONG = 6
+# places of a triple compared when no long key matches
+MAX_CANDIDATES = 256
+
+
+def tripleKey(a, b, c):
+    """ 64 bit hash of three numbers, the same in every process """
+    h = (a & MASK) * 0x9E3779B97F4A7C15 & MASK
+    h = (h ^ (b & MASK)) * 0xC2B2AE3D27D4EB4F & MASK
+    h = (h ^ (c & MASK)) * 0x165667B19E3779F9 & MASK
+    return h ^ h >> 31
+
+
+def longKey(numbers):
+    """ 64 bit hash of LONG numbers """
+    return tripleKey(tripleKey(*numbers[:3]), tripleKey(*numbers[3:]), LONG)
+
+
+class SequenceDatabase:
+    """ Known sequences in a file written by write()
+    Sequences are only turned into lists when they match.
+    Attributes:
+        path: the file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, order, count, total, entries,
+         long_entries) = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError("{} is not a sequence database".format(path))
+        if order.rstrip(b"\x00") != sys.byteorder.encode():
+            raise ValueError("{} was written on a {} endian machine".format(
+                path, order.rstrip(b"\x00").decode()))
+
+        self.view = memoryview(self.map)
+        self.offset = HEADER.size
+        self.starts = self.section(count + 1, "Q")
+        self.numbers = self.section(total, "q")
+        self.names = self.section(count, "I")
+        self.familiarities = self.section(count, "B")
+        self.offset += -self.offset % 8
+        self.keys = self.section(entries, "Q")
+        self.places = self.section(entries, "Q")
+        self.long_keys = self.section(long_entries, "Q")
+        self.long_places = self.section(long_entries, "Q")
+
+    def section(self, size, typecode):
+        end = self.offset + size * struct.calcsize(typecode)
+        part = self.view[self.offset:end].cast(typecode)
+        self.offset = end
+        return part
+
+    def sequence(self, id):
+        """ Return the sequence with the given id as a WellKnownSequence """
+        numbers = tuple(self.numbers[self.starts[id]:self.starts[id + 1]])
+        name = self.names[id]
+        return WellKnownSequence(numbers,
+                                 familiarity=self.familiarities[id],
+                                 name="A{:06d}".format(name) if name else None)
+
+    def match(self, seq):
+        """ Return a tuple (match size, next number, matching sequence) or
+        (0, None, None) like SequenceIndex.match (see find) """
+        return self.find(seq)[:3]
+
+    def find(self, seq):
+        """ Find the best match of seq like SequenceIndex.match does, but
+        sequences are not read backwards. When nothing matches the last
+        LONG numbers of seq only the first MAX_CANDIDATES sequences with
+        its last triple are compared, a better match may be missed then.
+        Return a tuple (match size, next number, matching sequence,
+        truncated), truncated is True if some candidates were not compared
+        (else the match is the one of SequenceIndex.match)
+        """
+        if len(seq) < 3:
+            return (0, None, None, False)
+        try:
+            key = tripleKey(seq[-3], seq[-2], seq[-1])
+            long_key = longKey(seq[-LONG:]) if len(seq) >= LONG else None
+        except TypeError:
+            return (0, None, None, False)
+
+        best_size, truncated = 0, False
+        if long_key is not None:
+            # every match of LONG numbers or more is there
+            best_size, best_next, best_id, _ = self.scan(
+                self.long_keys, self.long_places, long_key, seq)
+        if not best_size:
+            best_size, best_next, best_id, truncated = self.scan(
+                self.keys, self.places, key, seq,
+                min(len(seq), LONG - 1), MAX_CANDIDATES)
+        if not best_size:
+            return (0, None, None, truncated)
+        return (best_size, best_next, self.sequence(best_id), truncated)
+
+    def scan(self, keys, places, key, seq, longest=None, limit=None):
+        """ Return (size, next number, id, truncated) of the best match of
+        seq among places of key, size is 0 if nothing matches. The scan
+        stops when no later sequence can match more than longest or after
+        limit places, then truncated is True if there were more.
+        """
+        numbers, starts = self.numbers, self.starts
+        lo = bisect_left(keys, key)
+        hi = bisect_right(keys, key, lo)
+        truncated = limit is not None and hi > lo + limit
+        if truncated:
+            hi = lo + limit
+        best_size, best_next, best_id, best_b = 0, None, None, -1
+
+        # ids and positions of a key are in increasing order
+        for place in places[lo:hi]:
+            id, b = place >> 32, place & 0xFFFFFFFF
+            if best_size == longest and id != best_id:
+                # the later places could not match more
+                truncated = False
+                break
+            start = starts[id]
+            i, j = start + b, len(seq) - 1
+            while i >= start and j >= 0 and numbers[i] == seq[j]:
+                i, j = i - 1, j - 1
+            if i >= start and j >= 0:
+                continue
+            size = start + b - i
+            if size > best_size or (size == best_size and id == best_id and
+                                    b > best_b):
+                best_size, best_id, best_b = size, id, b
+                best_next = numbers[start + b + 1]
+        return best_size, best_next, best_id, truncated
+
+    def close(self):
+        for part in (self.starts, self.numbers, self.names,
+                     self.familiarities, self.keys, self.places,
+                     self.long_keys, self.long_places, self.view):
+            part.release()
+        self.map.close()
+
+    def __len__(self):
+        return len(self.names)
+
+    def __repr__(self):
+        return "<SequenceDatabase {} ({} sequences)>".format(self.path,
+                                                             len(self))
+
+
+def write(path, sequences):
+    """ Write a database of sequences, an iterable of tuples
+    (A-number or 0, numbers, familiarity). Sequences are cut before
+    their first number that does not fit in int64.
+    Return the number of written sequences
+    """
+    starts = array("Q", [0])
+    numbers = array("q")
+    names = array("I")
+    familiarities = array("B")
+    keys, places = array("Q"), array("Q")
+    long_keys, long_places = array("Q"), array("Q")
+
+    for name, seq, familiarity in sequences:
+        seq = list(seq)
+        for i, number in enumerate(seq):
+            if not -INT64 <= number < INT64:
+                del seq[i:]
+                break
+        id = len(names)
+        numbers.extend(seq)
+        starts.append(len(numbers))
+        names.append(name)
+        familiarities.append(familiarity)
+        # triples[b - 2] is the key of the triple ending at b
+        triples = [tripleKey(seq[b - 2], seq[b - 1], seq[b])
+                   for b in range(2, len(seq))]
+        for b in range(2, len(seq) - 1):
+            keys.append(triples[b - 2])
+            places.append(id << 32 | b)
+        # same as longKey(seq[b - 5:b + 1])
+        for b in range(LONG - 1, len(seq) - 1):
+            long_keys.append(tripleKey(triples[b - 5], triples[b - 2], LONG))
+            long_places.append(id << 32 | b)
+
+    keys, places = sortIndex(keys, places)
+    long_keys, long_places = sortIndex(long_keys, long_places)
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, sys.byteorder.encode(), len(names),
+                            len(numbers), len(keys), len(long_keys)))
+        for part in (starts, numbers, names, familiarities):
+            part.tofile(f)
+        f.write(b"\x00" * (-f.tell() % 8))
+        for part in (keys, places, long_keys, long_places):
+            part.tofile(f)
+    return len(names)
+
+
+def sortIndex(keys, places):
+    """ Return keys and places sorted by keys, a stable sort keeps places
+    of a key in order """
+    if numpy is not None:
+        order = numpy.argsort(numpy.frombuffer(keys, dtype=numpy.uint64),
+                              kind="stable")
+        return (array("Q", numpy.frombuffer(keys, dtype=numpy.uint64)[order]),
+                array("Q",
+                      numpy.frombuffer(places, dtype=numpy.uint64)[order]))
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    return (array("Q", map(keys.__getitem__, order)),
+            array("Q", map(places.__getitem__, order)))
+
+
+def readStripped(lines):
+    """ Yield (A-number, numbers) of lines like "A000045 ,0,1,1,2,3," """
+    for line in lines:
+        if not line.startswith("A"):
+            continue
+        name, _, numbers = line.partition(" ")
+        yield int(name[1:]), [int(i) for i in numbers.split(",") if i.strip()]
+
+
+def readBFile(lines):
+    """ Return numbers of a b-file, lines are "n a(n)" or comments """
+    numbers = []
+    for line in lines:
+        line = line.split("#")[0].split()
+        if len(line) >= 2:
+            numbers.append(int(line[1]))
+    return numbers
+
+
+def readFiles(paths):
+    """ Yield (A-number, numbers) found in b-files and stripped files """
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt") as lines:
+            bfile = re.match(r"b(\d+)\.txt$", os.path.basename(path))
+            if bfile:
+                yield int(bfile.group(1)), readBFile(lines)
+            else:
+                yield from readStripped(lines)
+
+
+def test():
+    from tempfile import TemporaryDirectory
+    from seq_index import SequenceIndex
+    from database import known_sequences
+
+    sequences = [(0, seq, seq.familiarity) for seq in known_sequences]
+    sequences.append((45, [0, 1, 1, 2, 3, 5, 8, 13, 2**70], 5))
+    index = SequenceIndex(seq for _, seq, _ in sequences)
+    with TemporaryDirectory() as directory:
+        path = os.path.join(directory, "test.db")
+        assert write(path, sequences) == len(sequences)
+        db = SequenceDatabase(path)
+        assert len(db) == len(sequences)
+        for seq in ([1, 4, 9], [4, 9, 16, 25], [8, 16, 32, 64],
+                    [2, 3, 5, 7], [1, 2, 3], [3, 5, 8], [99, 1, 2, 4],
+                    [1, 4, 9, 16, 25, 36], [0, 1, 1, 2, 3, 5, 8],
+                    [7, 1, 2, 3, 4, 5, 6], [9, 9, 1, 2, 4, 8]):
+            size, number, matching = db.match(seq)
+            assert (size, number) == index.match(seq)[:2], seq
+        fibonacci = db.match([2, 3, 5, 8])[2]
+        assert fibonacci == [0, 1, 1, 2, 3, 5, 8, 13]
+        assert fibonacci.name == "A000045" and fibonacci.familiarity == 5
+        db.close()
+
+        # more sequences share the triple 1, 2, 3 than are compared
+        crowded = [(0, [100 + i, 1, 2, 3, i], 4)
+                   for i in range(MAX_CANDIDATES + 10)]
+        assert write(path, crowded) == len(crowded)
+        db = SequenceDatabase(path)
+        index = SequenceIndex(seq for _, seq, _ in crowded)
+        last = 100 + len(crowded) - 1
+        assert index.match([last, 1, 2, 3])[:2] == (4, len(crowded) - 1)
+        assert db.find([last, 1, 2, 3]) == (0, None, None, True)
+        size, number, _, truncated = db.find([100, 1, 2, 3])
+        assert (size, number, truncated) == (4, 0, False)
+        assert db.find([1, 2, 3])[3] is False
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("database", help="the file to write")
+    parser.add_argument("files", nargs="+",
+                        help="OEIS stripped files (may be .gz) or b-files")
+    parser.add_argument("--familiarity", type=int, default=4,
+                        help="numbers needed to recognize a sequence")
+    parser.add_argument("--min-length", type=int, default=5)
+    args = parser.parse_args()
+
+    sequences = ((name, numbers, args.familiarity)
+                 for name, numbers in readFiles(args.files)
+                 if len(numbers) >= args.min_length)
+    count = write(args.database, sequences)
+    print("{} sequences written to {}".format(count, args.database))
+
+
+if __name__ == "__main__":
+    main()
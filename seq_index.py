@@ -0,0 +1,124 @@
+"""
+Index of known sequences for fast look up
+
+A match (see helper.match_seq) is a place in a known sequence where the
+searched sequence ends, so that the known sequence has a next number there.
+Either the whole searched sequence appears there or the known sequence
+starts there with a tail of the searched sequence. Every match of the
+accepted size (3 or more) ends with the last three numbers of the searched
+sequence, so only places ending with them are checked.
+"""
+
+
+class SequenceIndex:
+    """ Index of sequences by their successive triples
+    Attributes:
+        sequences: dict of id --> indexed sequence
+        reversible: if True sequences also match when read backwards
+    """
+
+    def __init__(self, sequences=(), reversible=False):
+        self.sequences = {}
+        self.reversible = reversible
+        # (a, b, c) --> {id: [positions of c]}
+        self.forward = {}
+        # (a, b, c) --> {id: [positions of c]} reading backwards
+        self.backward = {}
+        self.next_id = 0
+
+        for seq in sequences:
+            self.add(seq)
+
+    def add(self, seq):
+        """ Index seq and return its id """
+        id = self.next_id
+        self.next_id += 1
+        self.sequences[id] = seq
+
+        for key, b in self.triples(seq):
+            self.forward.setdefault(key, {}).setdefault(id, []).append(b)
+        if self.reversible:
+            for key, b in self.triples(seq, backward=True):
+                self.backward.setdefault(key, {}).setdefault(id, []).append(b)
+        return id
+
+    def remove(self, id):
+        """ Remove the sequence with the given id from the index """
+        seq = self.sequences.pop(id)
+        self.unindex(self.forward, id, self.triples(seq))
+        if self.reversible:
+            self.unindex(self.backward, id, self.triples(seq, backward=True))
+
+    @staticmethod
+    def unindex(table, id, triples):
+        for key, b in triples:
+            places = table.get(key)
+            if places is not None and places.pop(id, None) is not None:
+                if not places:
+                    del table[key]
+
+    @staticmethod
+    def triples(seq, backward=False):
+        """ Iterate (triple, position of its last number) that are followed
+        by a next number """
+        if backward:
+            for b in range(len(seq) - 3, 0, -1):
+                yield (seq[b + 2], seq[b + 1], seq[b]), b
+        else:
+            for b in range(2, len(seq) - 1):
+                yield (seq[b - 2], seq[b - 1], seq[b]), b
+
+    def match(self, seq):
+        """ Find the best match of seq in indexed sequences
+        The longest match wins, then the earliest added sequence (sequences
+        read backwards come after all the others), then the latest place.
+
+        Return a tuple (match size, next number, matching sequence)
+        or (0, None, None)
+        """
+        if len(seq) < 3:
+            return (0, None, None)
+
+        key = (seq[-3], seq[-2], seq[-1])
+        best = (0, None, None, None)  # size, next number, id, backward
+        best_b = -1
+
+        for id, places in self.forward.get(key, {}).items():
+            known = self.sequences[id]
+            for b in places:
+                i, j = b - 3, len(seq) - 4
+                while i >= 0 and j >= 0 and known[i] == seq[j]:
+                    i, j = i - 1, j - 1
+                if i >= 0 and j >= 0:
+                    continue
+                size = b - i
+                if size > best[0] or (size == best[0] and id == best[2] and
+                                      b > best_b):
+                    best, best_b = (size, known[b + 1], id, False), b
+
+        for id, places in self.backward.get(key, {}).items():
+            known = self.sequences[id]
+            last = len(known) - 1
+            for b in places:
+                # here b is the position in the forward reading
+                i, j = b + 3, len(seq) - 4
+                while i <= last and j >= 0 and known[i] == seq[j]:
+                    i, j = i + 1, j - 1
+                if i <= last and j >= 0:
+                    continue
+                size = i - b
+                if size > best[0] or (size == best[0] and id == best[2] and
+                                      best[3] and b < best_b):
+                    best, best_b = (size, known[b - 1], id, True), b
+
+        size, next_number, id, backward = best
+        if not size:
+            return (0, None, None)
+
+        matching_seq = self.sequences[id]
+        if backward:
+            matching_seq = matching_seq.reversed_copy()
+        return (size, next_number, matching_seq)
+
+    def __len__(self):
+        return len(self.sequences)
@@ -0,0 +1,339 @@
+"""
+Compiled sequence models
+
+A model is the rule a search found for a sequence together with the few
+numbers the rule needs to go on (like the last number for differences), so
+it continues the sequence without the sequence and without searching:
+    model = search.findNext(seq, model=True).extra_info["model"]
+    model.take(100)                   # the next 100 numbers
+    text = model.dumps()              # compact JSON (pack() compresses it)
+    Model.loads(text).take(100)       # the same numbers
+Models are iterable, iterating gives next numbers until the rule runs out
+(a matched known sequence ends or a recurrence stops giving integers).
+"""
+import json
+import zlib
+from abc import ABC, abstractmethod
+from fractions import Fraction
+from functools import reduce
+from itertools import cycle, islice
+from math import gcd
+
+from seq_cache import CanonicalCache
+
+
+class Model(ABC):
+    """ Base class of models, kind is the name used in JSON """
+    kind = None
+    kinds = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.kind is not None:
+            Model.kinds[cls.kind] = cls
+
+    @abstractmethod
+    def __iter__(self):
+        """ Yield the next numbers """
+
+    def take(self, k):
+        """ Return a list of the next k numbers (fewer if it runs out) """
+        return list(islice(self, k))
+
+    @abstractmethod
+    def toDict(self):
+        """ Return a dict of JSON types """
+
+    @staticmethod
+    def fromDict(data):
+        cls = Model.kinds.get(data.get("kind"))
+        if cls is None:
+            raise ValueError("unknown model {!r}".format(data.get("kind")))
+        return cls.fromDict(data)
+
+    def dumps(self):
+        return json.dumps(self.toDict(), separators=(",", ":"))
+
+    @staticmethod
+    def loads(text):
+        return Model.fromDict(json.loads(text))
+
+    def pack(self):
+        """ Return the JSON compressed as bytes """
+        return zlib.compress(self.dumps().encode())
+
+    @staticmethod
+    def unpack(data):
+        return Model.loads(zlib.decompress(data).decode())
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.toDict() == other.toDict()
+
+    def __repr__(self):
+        return "<{} {}>".format(type(self).__name__, self.dumps()[:60])
+
+
+class Constant(Model):
+    kind = "constant"
+
+    def __init__(self, value):
+        self.value = value
+
+    def __iter__(self):
+        while True:
+            yield self.value
+
+    def toDict(self):
+        return {"kind": self.kind, "value": self.value}
+
+    @classmethod
+    def fromDict(cls, data):
+        return cls(data["value"])
+
+
+class Numbers(Model):
+    """ Given numbers, repeated for ever if repeat is True """
+    kind = "numbers"
+
+    def __init__(self, numbers, repeat=False):
+        self.numbers = list(numbers)
+        self.repeat = repeat
+
+    def __iter__(self):
+        return cycle(self.numbers) if self.repeat else iter(self.numbers)
+
+    def toDict(self):
+        return {"kind": self.kind, "numbers": self.numbers,
+                "repeat": self.repeat}
+
+    @classmethod
+    def fromDict(cls, data):
+        return cls(data["numbers"], data["repeat"])
+
+
+class Recurrence(Model):
+    """ a(n) = (factors[0] * a(n-1) + factors[1] * a(n-2) + ...) / denominator
+    going on from the last numbers
+    """
+    kind = "recurrence"
+
+    def __init__(self, factors, denominator, last):
+        self.factors = list(factors)
+        self.denominator = denominator
+        self.last = list(last)
+
+    def __iter__(self):
+        numbers = list(self.last)
+        order = len(self.factors)
+        while True:
+            number, rest = divmod(sum(c * numbers[-i] for i, c
+                                      in enumerate(self.factors, 1)),
+                                  self.denominator)
+            if rest:
+                return
+            yield number
+            numbers.append(number)
+            del numbers[:-order]
+
+    def toDict(self):
+        return {"kind": self.kind, "factors": self.factors,
+                "denominator": self.denominator, "last": self.last}
+
+    @classmethod
+    def fromDict(cls, data):
+        return cls(data["factors"], data["denominator"], data["last"])
+
+
+class Steps(Model):
+    """ Base class of models of a representation: next numbers are put
+    together from next numbers of the models of its parts
+    """
+    # names of the parts
+    parts = ()
+
+    def __init__(self, last, *parts):
+        self.last = last
+        for name, part in zip(self.parts, parts):
+            setattr(self, name, part)
+
+    def toDict(self):
+        data = {"kind": self.kind, "last": self.last}
+        for name in self.parts:
+            data[name] = getattr(self, name).toDict()
+        return data
+
+    @classmethod
+    def fromDict(cls, data):
+        return cls(data["last"], *(Model.fromDict(data[name])
+                                   for name in cls.parts))
+
+
+class Diff(Steps):
+    kind = "diff"
+    parts = ("differences",)
+
+    def __iter__(self):
+        number = self.last
+        for difference in self.differences:
+            number += difference
+            yield number
+
+
+class Ratio(Steps):
+    kind = "ratio"
+    parts = ("ratios",)
+
+    def __iter__(self):
+        number = self.last
+        for ratio in self.ratios:
+            number *= ratio
+            yield number
+
+
+class DivMod(Steps):
+    """ Both DivModRepr and DivModRepr2 go on by number * div + mod """
+    kind = "divmod"
+    parts = ("divs", "mods")
+
+    def __iter__(self):
+        number = self.last
+        for div, mod in zip(self.divs, self.mods):
+            number = number * div + mod
+            yield number
+
+
+class Alter(Steps):
+    """ last is 0 if the next number is at an even position, else 1 """
+    kind = "alter"
+    parts = ("evens", "odds")
+
+    def __iter__(self):
+        halves = [iter(self.evens), iter(self.odds)]
+        position = self.last
+        while True:
+            number = next(halves[position % 2], None)
+            if number is None:
+                return
+            yield number
+            position += 1
+
+
+class Abs(Steps):
+    """ last is not used """
+    kind = "abs"
+    parts = ("values", "signs")
+
+    def __iter__(self):
+        for value, sign in zip(self.values, self.signs):
+            yield sign * value
+
+
+class Affine(Steps):
+    """ Numbers of the known model times ratio plus offset, last is
+    [ratio numerator, ratio denominator, offset numerator,
+     offset denominator] """
+    kind = "affine"
+    parts = ("known",)
+
+    def __iter__(self):
+        ratio = Fraction(*self.last[:2])
+        offset = Fraction(*self.last[2:])
+        for number in self.known:
+            number = ratio * number + offset
+            if number.denominator != 1:
+                return
+            yield int(number)
+
+
+def matchPlace(known, seq, value):
+    """ Return the place of value in known after the longest match with
+    the end of seq, the latest one of those (like SequenceIndex.match),
+    or None """
+    best_size, best_place = 0, None
+    for place in range(len(known)):
+        if known[place] != value:
+            continue
+        size = 0
+        while (size < place and size < len(seq) and
+               known[place - size - 1] == seq[-size - 1]):
+            size += 1
+        if size < min(place, len(seq)):
+            continue
+        if size >= best_size:
+            best_size, best_place = size, place
+    return best_place
+
+
+def compileResult(result, seq):
+    """ Return the Model of a search result of seq (see search.SearchResult)
+    or None if it has no value """
+    if result.value is None:
+        return None
+    method = result.method.__name__ if result.method else None
+    children = [compileResult(part_result, part)
+                for part, _, part_result in result.steps
+                if part_result is not None]
+
+    if method is None:
+        if not result.steps:
+            return Constant(seq[0])
+        # the answer of a shifted and scaled sequence (see search.findNext)
+        known_seq = result.steps[0][0]
+        _, known_shift, known_scale = CanonicalCache.canonical(known_seq)
+        _, shift, scale = CanonicalCache.canonical(seq)
+        ratio = Fraction(scale, known_scale)
+        offset = shift - ratio * known_shift
+        return Affine([ratio.numerator, ratio.denominator,
+                       offset.numerator, offset.denominator], *children)
+    if method == "byLookUp":
+        known = result.extra_info["matching sequence"]
+        place = matchPlace(known, seq, result.value)
+        if place is None:
+            return Numbers([result.value])
+        if known == seq:
+            # a periodic sequence matching itself repeats its last period
+            return Numbers(seq[place:], repeat=True)
+        return Numbers(known[place:])
+    if method == "byRecurrence":
+        coefficients = result.extra_info["coefficients"]
+        # integers over a common denominator
+        denominator = reduce(lambda a, b: a * b // gcd(a, b),
+                             (c.denominator for c in coefficients), 1)
+        factors = [int(c * denominator) for c in coefficients]
+        return Recurrence(factors, denominator, seq[-len(factors):])
+
+    if None in children:
+        return None
+    if method == "byDiff":
+        return Diff(seq[-1], *children)
+    if method == "byRatio":
+        return Ratio(seq[-1], *children)
+    if method in ("byDivMod", "byDivMod2"):
+        return DivMod(seq[-1], *children)
+    if method == "byAlter":
+        return Alter(len(seq) % 2, *children)
+    if method == "byAbs":
+        return Abs(0, *children)
+    raise ValueError("can not compile {}".format(method))
+
+
+def test():
+    import search
+
+    search.report = False
+    for seq in ([1, 4, 9, 16, 25], [2, 3, 5, 8, 13, 21],
+                [1, -2, 3, -4, 5, -6, 7], [1, 2, 1, 2, 1, 2, 1],
+                [1, 10, 3, 9, 5, 8, 7], [2, 4, 12, 48, 240],
+                [1, 1, 2, 6, 24, 120], [5, 7, 5, 7, 5, 7]):
+        model = search.findNext(seq, remember=False,
+                                model=True).extra_info["model"]
+        numbers = model.take(20)
+        assert numbers == search.predict(seq, 20, remember=False)[
+            :len(numbers)], seq
+        loaded = Model.loads(model.dumps())
+        assert loaded == model and loaded.take(20) == numbers
+        assert Model.unpack(model.pack()) == model
+
+
+if __name__ == "__main__":
+    test()
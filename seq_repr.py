@@ -4,14 +4,135 @@ Some sequence representation classes
 1. by difference [1, 2, 3, 4] -- > (1, [1, 1, 1])
 2. by digits [12, 23, 34, 45] -- > [[1, 2], [2, 3], [3, 4], [4, 5]]
 
+
+Sequences are immutable NormalReprs, so representations share them and
+they can be dictionary keys.
+Long sequences of integers are converted with numpy when it is installed.
 """
+from itertools import accumulate
+from operator import floordiv, mod as modulo, mul
+from weakref import ref
 from helper import sign, iter_pairs
+try:
+    import numpy
+except ImportError:
+    numpy = None
 __all__ = ("AlterRepr", "DiffRepr", "NormalRepr", "AbsRepr", "RatioRepr",
-           "DivModRepr", "DivModRepr2")
+           "DivModRepr", "DivModRepr2", "Features", "features")
+
+# sequences at least this long are converted with numpy
+vector_size = 64
+# sums and differences of numbers smaller than this fit in int64
+int64_safe = 2 ** 62
+
+
+def asArray(seq):
+    """ Return seq as a numpy array, or None if it should be converted by
+    Python loops (numpy is missing, seq is short or not all integers).
+    The array is of int64 if the numbers are small enough and of Python
+    integers (dtype object) otherwise. NormalRepr keeps its array.
+    """
+    if numpy is None or len(seq) < vector_size:
+        return None
+
+    arr = getattr(seq, "array", None)
+    if arr is None or len(arr) != len(seq):
+        if set(map(type, seq)) != {int}:
+            return None
+        try:
+            arr = numpy.array(seq, dtype=numpy.int64)
+        except OverflowError:
+            arr = numpy.array(seq, dtype=object)
+        if isinstance(seq, NormalRepr):
+            seq.array = arr
+
+    if arr.dtype != object and not (-int64_safe < arr.min() and
+                                    arr.max() < int64_safe):
+        arr = arr.astype(object)
+    return arr
+
+
+def fromArray(arr):
+    """ Return NormalRepr of a numpy array of integers """
+    seq = NormalRepr(arr.tolist())
+    seq.array = arr
+    return seq
+
+
+class Features:
+    """ What representations need to know about a sequence, found once
+    Attributes:
+        all_int: all numbers are int
+        has_zero: some number is 0
+        has_negative: some number is negative
+        constant: all numbers are equal
+        signs_only: all numbers are -1, 0 or 1
+        divmods: (divs, mods) NormalReprs of divmod(seq[i + 1], seq[i]),
+                 None if a number that divides is 0 or some number is not
+                 int. Found when first asked for, None if the NormalRepr
+                 was collected before.
+        divisible: every number divides the next one
+        key: seq_schedule.SequenceKey of the sequence or None, kept here
+             by seq_schedule.sequenceKey
+    """
+    __slots__ = ("all_int", "has_zero", "has_negative", "constant",
+                 "signs_only", "seq", "_divmods", "key")
+
+    def __init__(self, seq):
+        numbers = getattr(seq, "numbers", seq)
+        self.all_int = set(map(type, numbers)) == {int}
+        low, high = min(numbers, default=0), max(numbers, default=0)
+        self.has_zero = 0 in numbers
+        self.has_negative = low < 0
+        self.constant = low == high
+        self.signs_only = -1 <= low and high <= 1
+        # NormalRepr keeps its Features, so they only refer to it weakly
+        if isinstance(seq, NormalRepr):
+            self.seq = ref(seq)
+        else:
+            self.seq = lambda: seq
+        self._divmods = None
+        self.key = None
+
+    @property
+    def divmods(self):
+        if self._divmods is not None or not self.all_int:
+            return self._divmods
+        seq = self.seq()
+        if seq is None:
+            # the sequence is gone, nothing can be found any more
+            return None
+        numbers = getattr(seq, "numbers", seq)
+        if not (self.has_zero and 0 in numbers[:-1]):
+            arr = asArray(seq)
+            if arr is not None:
+                prev, cur = arr[:-1], arr[1:]
+                self._divmods = (fromArray(cur // prev), fromArray(cur % prev))
+            else:
+                cur, prev = numbers[1:], numbers[:-1]
+                self._divmods = (NormalRepr(map(floordiv, cur, prev)),
+                                 NormalRepr(map(modulo, cur, prev)))
+        return self._divmods
+
+    @property
+    def divisible(self):
+        divmods = self.divmods
+        return divmods is not None and not any(divmods[1])
+
+
+def features(seq):
+    """ Return Features of seq, NormalRepr keeps them (like its array) """
+    if not isinstance(seq, NormalRepr):
+        return Features(seq)
+    if seq.features is None:
+        seq.features = Features(seq)
+    return seq.features
 
 
 class Representation:
     """ Base class for representing sequences """
+    __slots__ = ()
+
     @classmethod
     def isConsidering(cls, seq):
         """ Check if this representation worth considering for this sequence
@@ -19,66 +140,113 @@ class Representation:
         return True
 
 
-class NormalRepr(list, Representation):
-    """ Normal sequence representation """
+class NormalRepr(Representation):
+    """ Normal sequence representation: an immutable sequence of numbers
+    It compares equal to lists and tuples of the same numbers and hashes
+    like the tuple, so it can be a dictionary key. Slices are NormalReprs.
+    Attributes:
+        numbers: tuple of the numbers
+        array: numpy array of the numbers or None (see asArray)
+        features: Features of the numbers or None (see features)
+    """
+    __slots__ = ("numbers", "array", "features", "_hash", "__weakref__")
+
+    def __init__(self, numbers=()):
+        if isinstance(numbers, NormalRepr):
+            numbers = numbers.numbers
+        # a tuple is kept as it is
+        self.numbers = tuple(numbers)
+        self.array = None
+        self.features = None
+        self._hash = None
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def __iter__(self):
+        return iter(self.numbers)
+
+    def __reversed__(self):
+        return reversed(self.numbers)
+
+    def __contains__(self, number):
+        return number in self.numbers
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return NormalRepr(self.numbers[index])
+        return self.numbers[index]
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(self.numbers)
+        return self._hash
+
+    def __eq__(self, other):
+        if isinstance(other, NormalRepr):
+            if (self._hash is not None and other._hash is not None and
+                    self._hash != other._hash):
+                return False
+            return self.numbers == other.numbers
+        if isinstance(other, (tuple, list)):
+            return self.numbers == tuple(other)
+        return NotImplemented
+
+    def __reduce__(self):
+        return NormalRepr, (self.numbers,)
 
     def __repr__(self):
-        return list.__repr__(self)
+        return repr(list(self.numbers))
 
     def readable(self):
         """ [1, 2, 3, 4] --> "1, 2, 3, 4" """
-        return ", ".join(map(str, self))
+        return ", ".join(map(str, self.numbers))
 
     def __add__(self, other):
         if type(other) in (int, float):
-            seq = [i + other for i in self]
+            seq = [i + other for i in self.numbers]
             return NormalRepr(seq)
-        return super().__add__(other)
+        return NormalRepr(self.numbers + tuple(other))
 
     def __sub__(self, other):
         if type(other) in (int, float):
-            seq = [i - other for i in self]
+            seq = [i - other for i in self.numbers]
             return NormalRepr(seq)
         else:
             seq = [i - j for i, j in zip(reversed(self), reversed(other))]
             return NormalRepr(seq)
 
     def __mul__(self, other):
-        seq = [i * other for i in self]
+        seq = [i * other for i in self.numbers]
         return NormalRepr(seq)
 
     def __rmul__(self, other):
-        seq = [i * other for i in self]
+        seq = [i * other for i in self.numbers]
         return NormalRepr(seq)
 
     def __radd__(self, other):
-        seq = [i + other for i in self]
+        seq = [i + other for i in self.numbers]
         return NormalRepr(seq)
 
     def __div__(self, other):
-        seq = [i / other for i in self]
+        seq = [i / other for i in self.numbers]
         return NormalRepr(seq)
 
     def reversed_copy(self):
         """ Return a reversed copy of the sequence """
-        return self.__class__([self[::-1]])
+        return NormalRepr(self.numbers[::-1])
 
     def is_constant(self):
-        it = iter(self)
-        first = next(it)
-        for i in it:
-            if i != first:
-                return False
-        return True
+        return features(self).constant
 
 
 class AlterRepr(Representation):
     """ [1, 2, 3, 4, 5] --> ([1, 3, 5], [2, 4]) """
     @classmethod
     def convert(cls, seq):
-        size = len(seq)
-        evens = NormalRepr([seq[2 * i] for i in range((size + 1) // 2)])
-        odds = NormalRepr([seq[2 * i + 1] for i in range(size // 2)])
+        numbers = getattr(seq, "numbers", seq)
+        evens = NormalRepr(numbers[0::2])
+        odds = NormalRepr(numbers[1::2])
         return AlterRepr(odds=odds, evens=evens)
 
     def __init__(self, odds, evens):
@@ -86,14 +254,20 @@ class AlterRepr(Representation):
         self.evens = evens
 
     def toNormal(self):
-        normal = NormalRepr([])
+        if len(self.evens) - len(self.odds) in (0, 1):
+            normal = [None] * (len(self.evens) + len(self.odds))
+            normal[0::2] = self.evens
+            normal[1::2] = self.odds
+            return NormalRepr(normal)
+
+        normal = []
         for i in range(len(self.evens)):
             try:
                 normal.append(self.evens[i])
                 normal.append(self.odds[i])
             except IndexError:
                 pass
-        return normal
+        return NormalRepr(normal)
 
     def __repr__(self):
         return "<AlterRepr ({}, {})>".format(self.evens, self.odds)
@@ -110,21 +284,20 @@ class AbsRepr(Representation):
     def isConsidering(cls, seq):
         """ Check if this representation worth considering for this sequence
         """
-        if not any(i < 0 for i in seq):
-            return False
-
-        signs = [sign(i) for i in seq]
-        if all(i == j for i, j in zip(signs, seq)):
-            return False
-        values = NormalRepr([abs(i) for i in seq])
-        if all(i == j for i, j in zip(values, seq)):
+        found = features(seq)
+        # without negative numbers values are seq, with only signs so are signs
+        if not found.has_negative or found.signs_only:
             return False
-
         return super().isConsidering(seq)
 
     @classmethod
     def convert(cls, seq):
         """ Return AbsRepr for seq """
+        arr = asArray(seq)
+        if arr is not None:
+            signs = (arr > 0).astype(int) - (arr < 0)
+            return AbsRepr(signs=fromArray(signs), values=fromArray(abs(arr)))
+
         signs = NormalRepr([sign(i) for i in seq])
         values = NormalRepr([abs(i) for i in seq])
         return AbsRepr(signs=signs, values=values)
@@ -134,17 +307,20 @@ class AbsRepr(Representation):
         self.values = values
 
     def toNormal(self):
-        return NormalRepr([s * v for s, v in zip(self.signs, self.abs_values)])
+        return NormalRepr(map(mul, self.signs, self.values))
 
     def __repr__(self):
-        return "<AlterRepr ({} with signs {})>".format(self.abs_values,
-                                                       self.signs)
+        return "<AbsRepr ({} with signs {})>".format(self.values,
+                                                     self.signs)
 
 
 class DiffRepr(Representation):
     @classmethod
     def convert(cls, seq):
         first = seq[0]
+        arr = asArray(seq)
+        if arr is not None:
+            return DiffRepr(first, fromArray(numpy.diff(arr)))
         differences = NormalRepr([num - prev_num for prev_num, num in iter_pairs(seq)])
         return DiffRepr(first, differences)
 
@@ -154,12 +330,7 @@ class DiffRepr(Representation):
 
     def toNormal(self):
         """ Return normal representation of the seq """
-        last = self.first
-        normal = NormalRepr([last])
-        for d in self.differences:
-            last += d
-            normal.append(last)
-        return normal
+        return NormalRepr(accumulate(self.differences, initial=self.first))
 
     def __repr__(self):
         return "<DiffRepr ({}, {})>".format(self.first, self.differences)
@@ -168,17 +339,14 @@ class DiffRepr(Representation):
 class RatioRepr(Representation):
     @classmethod
     def isConsidering(cls, seq):
-        try:
-            for i, ii in iter_pairs(seq):
-                if ii % i != 0:
-                    return False
-            return True
-        except ZeroDivisionError:
-            return False
+        return features(seq).divisible
 
     @classmethod
     def convert(cls, seq):
         first = seq[0]
+        found = features(seq)
+        if found.divisible:
+            return RatioRepr(first, found.divmods[0])
         ratios = NormalRepr([round(seq[i] / seq[i-1]) for i in range(1, len(seq))])
         return RatioRepr(first, ratios)
 
@@ -188,40 +356,69 @@ class RatioRepr(Representation):
 
     def toNormal(self):
         """ Return normal representation of the seq """
-        last = self.first
-        normal = NormalRepr([last])
-        for d in self.ratios:
-            last *= d
-            normal.append(last)
-        return normal
+        return NormalRepr(accumulate(self.ratios, mul, initial=self.first))
 
     def __repr__(self):
         return "<RatioRepr ({}, {})>".format(self.first, self.ratios)
 
 
 class DivModRepr(Representation):
+    """ Divs and mods of successive terms: divmod(seq[i + 1], seq[i]) is
+    (div + shift, mod - shift * seq[i])
+    """
+    shift = 0
+
     @classmethod
     def isConsidering(cls, seq):
-        if any(i == 0 or type(i) != int for i in seq):
+        found = features(seq)
+        if found.has_zero or not found.all_int:
             return False
         return super().isConsidering(seq)
 
     def __init__(self, normal):
         self.first = normal[0]
-        self.divs = NormalRepr([])
-        self.mods = NormalRepr([])
-        for i, ii in iter_pairs(normal):
-            div, mod = divmod(ii, i)
-            self.divs.append(div)
-            self.mods.append(mod)
+        shift = self.shift
+        divmods = features(normal).divmods
+        if divmods is None:
+            # raises like divmod for 0 and fails for numbers that are not int
+            divs, mods = [], []
+            for i, ii in iter_pairs(normal):
+                div, mod = divmod(ii, i)
+                divs.append(div + shift)
+                mods.append(mod - shift * i)
+            self.divs, self.mods = NormalRepr(divs), NormalRepr(mods)
+            return
+
+        # DivModRepr and DivModRepr2 of a sequence share its divmods
+        divs, mods = divmods
+        if not shift:
+            self.divs, self.mods = divs, mods
+            return
+        # divs and mods are one number shorter, they may be too short for
+        # arrays when normal is not
+        arr, div_arr, mod_arr = asArray(normal), asArray(divs), asArray(mods)
+        if not any(a is None for a in (arr, div_arr, mod_arr)):
+            self.divs = fromArray(div_arr + shift)
+            self.mods = fromArray(mod_arr - shift * arr[:-1])
+        else:
+            self.divs = NormalRepr([div + shift for div in divs])
+            self.mods = NormalRepr([mod - shift * i
+                                    for mod, i in zip(mods, normal)])
+
+    @classmethod
+    def fromParts(cls, first, divs, mods):
+        """ Return the representation with the given parts """
+        dm = cls(NormalRepr([first]))
+        dm.divs, dm.mods = divs, mods
+        return dm
 
     def toNormal(self):
         si = self.first
-        normal = NormalRepr([si])
+        normal = [si]
         for div, mod in zip(self.divs, self.mods):
             si = si * div + mod
             normal.append(si)
-        return normal
+        return NormalRepr(normal)
 
     def __repr__(self):
         return "<DivModRepr (first={}, divs={}, mods={})>".format(self.first,
@@ -230,14 +427,40 @@ class DivModRepr(Representation):
 
 
 class DivModRepr2(DivModRepr):
-    def __init__(self, normal):
-        self.first = normal[0]
-        self.divs = NormalRepr([])
-        self.mods = NormalRepr([])
-        for i, ii in iter_pairs(normal):
-            div, mod = divmod(ii, i)
-            self.divs.append(div + 1)
-            self.mods.append(mod - i)
+    shift = 1
+
+
+def test():
+    """ Check that numpy and Python loops convert alike """
+    global vector_size
+    seqs = [[(-3) ** (i % 5) * (i + 1) for i in range(100)],
+            [2 ** i for i in range(100)],
+            [(-1) ** i * (i * i + 1) for i in range(1000)],
+            # divs and mods of it are too short for arrays
+            [i * i + 1 for i in range(vector_size)]]
+    size = vector_size
+    try:
+        for numbers in seqs:
+            converted = []
+            for vector_size in (size, len(numbers) + 1):
+                # a new sequence has no array and features yet
+                seq = NormalRepr(numbers)
+                d = DivModRepr2(seq)
+                converted.append((DiffRepr.convert(seq).differences,
+                                  RatioRepr.isConsidering(seq),
+                                  AbsRepr.convert(seq).signs, d.divs, d.mods))
+                assert d.toNormal() == seq
+            assert converted[0] == converted[1]
+    finally:
+        vector_size = size
+
+    seq = NormalRepr([1, 2, 3, 4])
+    assert seq == [1, 2, 3, 4] and hash(seq) == hash((1, 2, 3, 4))
+    assert seq[1:3] == NormalRepr([2, 3]) != seq
+    assert {seq: 5}[NormalRepr(range(1, 5))] == 5
+    # features may outlive their sequence
+    found = features(NormalRepr([2, 4, 8]))
+    assert found.divmods is None and not found.divisible
 
 
 if __name__ == "__main__":
@@ -0,0 +1,269 @@
+"""
+Order of search methods learned from past searches
+
+Every searched sequence gets a cheap key of its features (signs, kind of
+numbers, divisibility, growth, parity, length). The scheduler counts how
+often each method won for sequences with the same key and tries the
+winners first, so the branch and bound of search.recursiveFindNext finds
+a good bound early and cuts the other methods sooner. Methods that can
+not consider sequences with the key are not tried at all. The order only
+changes how fast answers are found, not the answers. It is used when
+search.adaptive_order is True.
+    scheduler.record(seq, result)    # after a search
+    scheduler.save("priors.json")    # MethodScheduler(methods).load(...)
+Learn from the lab.py cases:
+    python seq_schedule.py priors.json
+"""
+import json
+import os
+from collections import namedtuple
+from operator import ne
+
+from seq_repr import features
+
+FORMAT = 1
+
+SequenceKey = namedtuple("SequenceKey", "sign numbers divisible growth "
+                                        "parity length")
+SequenceKey.__doc__ = """ Features of a sequence the scheduler tells apart,
+    the ones not found by seq_repr.Features only look at its last numbers
+    sign: "positive" (no negative number), "signs" (only -1, 0 and 1),
+          "alternating" (signs of the last numbers alternate) or
+          "negative"
+    numbers: "int" (no zero), "zero" (int with zeros) or "other"
+    divisible: "divisible" if the last numbers divide the next ones,
+               else ""
+    growth: "flat", "slow" or "fast" from the first to the last number
+            ("" if numbers are not int)
+    parity: "same", "alternating" or "mixed" parity of the last numbers
+            ("" if numbers are not int)
+    length: "short" (less than 4 numbers) or "long"
+"""
+
+# numbers at the end of a sequence looked at
+TAIL = 4
+
+
+def sequenceKey(seq):
+    """ Return the SequenceKey of seq, takes about the same time for
+    every length and is found once for a NormalRepr """
+    found = features(seq)
+    if found.key is None:
+        found.key = findKey(seq, found)
+    return found.key
+
+
+def findKey(seq, found):
+    """ Return the SequenceKey of seq with Features found """
+    numbers = getattr(seq, "numbers", seq)
+    tail = numbers[-TAIL:]
+    if not found.has_negative:
+        sign = "positive"
+    elif found.signs_only:
+        sign = "signs"
+    elif all(a * b < 0 for a, b in zip(tail, tail[1:])):
+        sign = "alternating"
+    else:
+        sign = "negative"
+
+    growth = parity = divisible = ""
+    if found.all_int:
+        kind = "zero" if found.has_zero else "int"
+        # bits gained per number, more than half a bit is exponential
+        gained = (abs(numbers[-1]).bit_length() -
+                  abs(numbers[0]).bit_length())
+        if gained <= 0:
+            growth = "flat"
+        else:
+            growth = "fast" if 2 * gained >= len(numbers) - 1 else "slow"
+        odd = [number & 1 for number in tail]
+        if len(set(odd)) == 1:
+            parity = "same"
+        elif all(map(ne, odd, odd[1:])):
+            parity = "alternating"
+        else:
+            parity = "mixed"
+        if 0 not in tail[:-1] and not any(b % a for a, b
+                                          in zip(tail, tail[1:])):
+            divisible = "divisible"
+    else:
+        kind = "other"
+    return SequenceKey(sign, kind, divisible, growth, parity,
+                       "short" if len(numbers) < 4 else "long")
+
+
+class MethodScheduler:
+    """ Learned order of search methods
+    Attributes:
+        methods: the search methods in their fixed order, ties between
+                 results of the same depth go to the first of them
+        considering: dict of method name --> function of a SequenceKey
+                     telling whether the method may consider sequences
+                     with the key (methods not in it always may)
+        first: names of methods always tried first (in their fixed order),
+               like cheap ones whose results can not be beaten
+        wins: dict of SequenceKey --> dict of method name --> number of
+              searched sequences with the key the method won
+        path: file the wins were loaded from or None
+    """
+
+    def __init__(self, methods, considering=None, first=()):
+        self.methods = tuple(methods)
+        self.considering = considering or {}
+        self.first = tuple(first)
+        self.wins = {}
+        self.path = None
+        # SequenceKey --> tuple of (rank, method) in the order to try them
+        self.orders = {}
+
+    def order(self, seq):
+        """ Return a tuple of (rank in methods, method) to try for seq,
+        methods that won more often for its key come first """
+        key = sequenceKey(seq)
+        order = self.orders.get(key)
+        if order is None:
+            wins = self.wins.get(key, {})
+            order = [(rank, f) for rank, f in enumerate(self.methods)
+                     if self.considering.get(f.__name__, bool)(key)]
+            order.sort(key=lambda item: (item[1].__name__ not in self.first,
+                                         -wins.get(item[1].__name__, 0),
+                                         item[0]))
+            order = self.orders[key] = tuple(order)
+        return order
+
+    def record(self, seq, result):
+        """ Count the wins of the methods in the derivation of result (a
+        search.SearchResult of seq) """
+        if result is None or result.value is None:
+            return
+        if result.method is not None:
+            key = sequenceKey(seq)
+            wins = self.wins.setdefault(key, {})
+            name = result.method.__name__
+            wins[name] = wins.get(name, 0) + 1
+            self.orders.pop(key, None)
+        for part, _, part_result in result.steps:
+            self.record(part, part_result)
+
+    def copy(self):
+        """ Return a scheduler with the same methods and a copy of the wins
+        """
+        scheduler = MethodScheduler(self.methods, self.considering,
+                                    self.first)
+        scheduler.wins = {key: dict(counts)
+                          for key, counts in self.wins.items()}
+        scheduler.path = self.path
+        return scheduler
+
+    def clear(self):
+        """ Forget all wins, methods are tried in their fixed order """
+        self.wins.clear()
+        self.orders.clear()
+
+    def save(self, path=None):
+        """ Write the wins as JSON to path (default: self.path) """
+        path = path or self.path
+        wins = {",".join(key): dict(counts) for key, counts
+                in sorted(self.wins.items())}
+        with open(path + ".tmp", "w") as f:
+            json.dump({"format": FORMAT, "wins": wins}, f, indent=1,
+                      sort_keys=True)
+        os.replace(path + ".tmp", path)
+
+    def load(self, path):
+        """ Replace the wins by the ones saved in path, a missing file
+        means no wins """
+        self.clear()
+        self.path = path
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        if data.get("format") != FORMAT:
+            raise ValueError("{} has unknown format {!r}".format(
+                path, data.get("format")))
+        for key, counts in data["wins"].items():
+            key = SequenceKey(*key.split(","))
+            self.wins[key] = {name: int(count)
+                              for name, count in counts.items()}
+
+    def __repr__(self):
+        return "<MethodScheduler {} keys>".format(len(self.wins))
+
+
+def test():
+    from tempfile import TemporaryDirectory
+    import search
+    import lab
+
+    key = sequenceKey([1, -2, 4, -8, 16])
+    assert key == ("alternating", "int", "divisible", "fast", "same", "long")
+    assert sequenceKey([1, 0, 1]).parity == "alternating"
+    assert sequenceKey([1.5, 2, 3]).numbers == "other"
+
+    search.report = False
+    old = search.method_scheduler, search.adaptive_order
+
+    def fresh():
+        return MethodScheduler(old[0].methods, old[0].considering,
+                               old[0].first)
+
+    try:
+        search.adaptive_order = False
+        fixed = [search.findNext(seq, remember=False)
+                 for seq, _ in lab.cases]
+
+        # even the reversed order gives the same answers
+        search.adaptive_order = True
+        search.method_scheduler = fresh()
+        search.method_scheduler.order = lambda seq: tuple(
+            enumerate(old[0].methods))[::-1]
+        for (seq, _), result in zip(lab.cases, fixed):
+            search.transposition_table.clear()
+            answer = search.findNext(seq, remember=False)
+            assert answer.value == result.value, seq
+            assert (answer.explain().string() ==
+                    result.explain().string()), seq
+
+        # wins are recorded by the searches
+        search.method_scheduler = fresh()
+        for (seq, _), result in zip(lab.cases, fixed):
+            search.transposition_table.clear()
+            answer = search.findNext(seq, remember=False)
+            assert answer.value == result.value, seq
+        assert search.method_scheduler.wins
+
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, "priors.json")
+            search.method_scheduler.save(path)
+            loaded = fresh()
+            loaded.load(path)
+            assert loaded.wins == search.method_scheduler.wins
+            loaded.load(os.path.join(directory, "missing.json"))
+            assert not loaded.wins
+    finally:
+        search.method_scheduler, search.adaptive_order = old
+
+
+def main():
+    import argparse
+    import search
+    from lab import cases, hard_cases
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("priors", help="the file to write (wins are added "
+                                       "to the ones in it)")
+    args = parser.parse_args()
+
+    search.report = False
+    search.configure(adaptive_order=True, method_priors=args.priors)
+    for seq, _ in cases + hard_cases:
+        search.findNext(seq, remember=False)
+    search.method_scheduler.save()
+    print("wins of {} keys written to {}".format(
+        len(search.method_scheduler.wins), args.priors))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+Prediction service
+
+Speaks JSON lines over TCP or a Unix socket. Every request line is like
+    {"id": 1, "sequence": [1, 2, 3], "explain": true, "timeout": 1.5}
+and gets an answer line (answers may come in a different order)
+    {"id": 1, "value": 4, "depth": 2, "proven": true,
+     "explanation": ["| 1, 2, 3 --> 4", ...]}
+or  {"id": 1, "error": "..."}
+With "model": true the answer also has the found rule as a seq_model.Model
+dict ("model", null if nothing was found), Model.fromDict of it gives the
+next numbers without searching.
+When the timeout passes the best answer found until then is sent with
+"proven" false (see search.findNext).
+A request {"id": 2, "stats": true} is answered with counters of the
+server and, when searches are profiled (--profile), of search methods
+    {"id": 2, "coalesced": 0, "profile": {"byDiff": {"calls": 10, ...}}}
+
+Identical requests (with equal timeouts) that are being searched at the
+same time share one search. Searches wait in a bounded queue, when it is
+full the server stops reading requests until there is room again.
+"""
+import argparse
+import asyncio
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from time import monotonic
+
+import search
+from seq_model import Model
+
+
+def predict(seq, explain=False, timeout=None, model=False):
+    """ Search seq and return the answer as a dict (runs in a worker),
+    like findNextMany seq is forgotten so answers do not depend on the
+    worker """
+    deadline = None if timeout is None else monotonic() + timeout
+    result = search.findNext(seq, remember=False, deadline=deadline,
+                             model=model)
+    proven = result.extra_info["proven"]
+    if result.value is None and not proven:
+        return {"error": "timeout"}
+    answer = {"value": result.value, "depth": result.depth, "proven": proven}
+    if explain:
+        answer["explanation"] = result.explain().string()
+    if model:
+        found = result.extra_info["model"]
+        answer["model"] = None if found is None else found.toDict()
+    if "profile" in result.extra_info:
+        answer["profile"] = result.extra_info["profile"]
+    return answer
+
+
+class PredictionServer:
+    """ Asyncio server answering predictions
+    Attributes:
+        workers: number of worker processes, 0 searches in a thread of this
+                 process (one search at a time)
+        max_queue: number of searches that may wait for a worker
+        coalesced: number of requests answered by another request's search
+    """
+
+    def __init__(self, workers=None, max_queue=64):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.coalesced = 0
+        self.executor = None
+        self.queue = None
+        # (sequence, explain, model, timeout) --> future of the answer
+        self.running = {}
+        self.tasks = []
+        self.server = None
+
+    async def start(self, host="127.0.0.1", port=0, path=None):
+        """ Start listening on host:port or on the Unix socket path """
+        if self.workers == 0:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        else:
+            remembered = [list(seq) for seq in search.local_known_sequences]
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=search._initWorker,
+                initargs=(search.config(), remembered))
+
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        consumers = self.workers
+        if consumers is None:
+            consumers = os.cpu_count() or 1
+        self.tasks = [asyncio.ensure_future(self.consume())
+                      for _ in range(max(consumers, 1))]
+
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self.serve, path)
+        else:
+            self.server = await asyncio.start_server(self.serve, host, port)
+        return self.server
+
+    @property
+    def address(self):
+        return self.server.sockets[0].getsockname()
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        # cancelling the consumers cancelled the calls they were waiting for
+        self.executor.shutdown(wait=False)
+
+    async def consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            args, future = await self.queue.get()
+            try:
+                answer = await loop.run_in_executor(self.executor, predict,
+                                                    *args)
+                profile = answer.pop("profile", None)
+                if profile is not None and self.workers != 0:
+                    # searched in another process
+                    search.mergeProfile(profile)
+                future.set_result(answer)
+            except Exception as error:
+                future.set_result({"error": repr(error)})
+            finally:
+                self.queue.task_done()
+
+    async def submit(self, request):
+        """ Return a future of the answer dict for a request dict.
+        Waits while the queue is full.
+        """
+        future = asyncio.get_running_loop().create_future()
+        try:
+            seq = [int(i) for i in request["sequence"]]
+        except (KeyError, TypeError, ValueError):
+            future.set_result({"error": "sequence should be a list of "
+                                        "integers"})
+            return future
+        explain = bool(request.get("explain", False))
+        timeout = request.get("timeout")
+        if timeout is not None and not isinstance(timeout, (int, float)):
+            future.set_result({"error": "timeout should be a number"})
+            return future
+        model = bool(request.get("model", False))
+
+        # a search with a shorter timeout may give up too early
+        key = (tuple(seq), explain, model, timeout)
+        if key in self.running:
+            self.coalesced += 1
+            return self.running[key]
+
+        self.running[key] = future
+        future.add_done_callback(lambda f: self.running.pop(key, None))
+        await self.queue.put(((seq, explain, timeout, model), future))
+        return future
+
+    async def serve(self, reader, writer):
+        lock = asyncio.Lock()
+        pending = set()
+
+        async def respond(id, future):
+            answer = dict(await future)
+            answer["id"] = id
+            async with lock:
+                writer.write(json.dumps(answer).encode() + b"\n")
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError
+                except ValueError:
+                    request = {"sequence": None}
+
+                if request.get("stats"):
+                    future = asyncio.get_running_loop().create_future()
+                    future.set_result({"coalesced": self.coalesced,
+                                       "profile": search.profileTotals()})
+                    task = asyncio.ensure_future(respond(request.get("id"),
+                                                         future))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+                    continue
+
+                # no more requests are read while the queue is full
+                future = await self.submit(request)
+                task = asyncio.ensure_future(respond(request.get("id"),
+                                                     future))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.wait(pending)
+        finally:
+            writer.close()
+
+
+async def request(reader, writer, seq, id=None, explain=False):
+    """ Send one request and read one answer (client side helper) """
+    message = {"id": id, "sequence": list(seq), "explain": explain}
+    writer.write(json.dumps(message).encode() + b"\n")
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+def test():
+    async def run():
+        server = PredictionServer(workers=0, max_queue=4)
+        await server.start()
+        host, port = server.address
+        reader, writer = await asyncio.open_connection(host, port)
+
+        answer = await request(reader, writer, [1, 2, 3, 4], id=1,
+                               explain=True)
+        assert answer["id"] == 1 and answer["value"] == 5
+        assert answer["explanation"][0].startswith("| 1, 2, 3, 4 --> 5")
+
+        message = {"id": 3, "sequence": [1, 4, 9, 16], "model": True}
+        writer.write(json.dumps(message).encode() + b"\n")
+        await writer.drain()
+        answer = json.loads(await reader.readline())
+        assert Model.fromDict(answer["model"]).take(2) == [25, 36]
+
+        answer = await request(reader, writer, ["a"], id=2)
+        assert answer["id"] == 2 and "error" in answer
+
+        # same sequences at the same time share searches
+        seqs = [[1, 4, 9, 16], [2, 4, 8]] * 10
+        for i, seq in enumerate(seqs):
+            message = {"id": i, "sequence": seq}
+            writer.write(json.dumps(message).encode() + b"\n")
+        await writer.drain()
+        answers = [json.loads(await reader.readline()) for _ in seqs]
+        for answer in answers:
+            assert answer["value"] == [25, 16][answer["id"] % 2]
+        assert server.coalesced > 0
+
+        # a request without timeout does not share a search with one
+        for id, timeout in ((5, 1e-9), (6, None)):
+            message = {"id": id, "sequence": [2, 5, 14, 41],
+                       "timeout": timeout}
+            writer.write(json.dumps(message).encode() + b"\n")
+        await writer.drain()
+        answers = [json.loads(await reader.readline()) for _ in range(2)]
+        assert [answer["value"] for answer in answers
+                if answer["id"] == 6] == [122]
+
+        stats = {"id": 4, "stats": True}
+        writer.write(json.dumps(stats).encode() + b"\n")
+        await writer.drain()
+        answer = json.loads(await reader.readline())
+        assert answer["id"] == 4 and answer["coalesced"] == server.coalesced
+
+        writer.close()
+        await writer.wait_closed()
+        await server.stop()
+
+    asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="listen on this Unix socket instead")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: number of cpus)")
+    parser.add_argument("--queue", type=int, default=64,
+                        help="searches that may wait for a worker")
+    parser.add_argument("--depth-limit", type=int, default=search.depth_limit)
+    parser.add_argument("--database",
+                        help="known sequences imported by seq_db.py")
+    parser.add_argument("--profile", action="store_true",
+                        help="count calls and time of search methods")
+    args = parser.parse_args()
+
+    search.configure(depth_limit=args.depth_limit, database=args.database,
+                     profile=args.profile, report=False)
+
+    async def run():
+        server = PredictionServer(workers=args.workers, max_queue=args.queue)
+        await server.start(args.host, args.port, args.unix)
+        print("listening on", args.unix or server.address, flush=True)
+        await server.server.serve_forever()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()